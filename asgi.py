@@ -0,0 +1,247 @@
+import asyncio
+import json
+import time
+
+from dudraw_companion import config, tracing
+from dudraw_companion.async_agent import AsyncDuDrawAgent
+from dudraw_companion.batch import BatchRequestError, parse_batch_request, run_batch_async
+from dudraw_companion.sandbox import final_answer_program, preview_payload, sandbox_pool
+from dudraw_companion.single_flight import run_outcome
+from dudraw_companion.warm_start import INSTANCE
+
+# Global async agent instance, shared by every in-flight request
+_agent = None
+_agent_lock = asyncio.Lock()
+
+async def get_async_agent():
+    """Returns the shared async agent, creating it once without blocking the event loop."""
+    global _agent
+    if _agent is None:
+        async with _agent_lock:
+            if _agent is None:
+                start = time.perf_counter()
+                _agent = await asyncio.to_thread(AsyncDuDrawAgent, config.OPENAI_API_KEY)
+                INSTANCE.record_init(time.perf_counter() - start)
+    return _agent
+
+
+# --- ASGI Application ---
+# Serves the same /api routes as api.py, e.g. `uvicorn asgi:app`
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, X-DuDraw-Cache"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-expose-headers", b"X-DuDraw-Cache"),
+]
+
+def _cache_bypassed(scope):
+    """Requests sending "X-DuDraw-Cache: bypass" always run the agent (the fresh result is still cached)."""
+    header = config.CACHE_HEADER.lower().encode("latin-1")
+    return any(name == header and value.lower() == b"bypass" for name, value in scope["headers"])
+
+async def _read_json_object(receive):
+    """
+    Reads the request body as a JSON object (an empty body is {}).
+    Returns (data, None), or (None, error message) for invalid JSON and for bodies that are not objects.
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    try:
+        data = json.loads(body or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        return None, f"Invalid JSON in request body: {str(e)}"
+    if not isinstance(data, dict):
+        return None, "Request body must be a JSON object"
+    return data, None
+
+async def _send_json(send, status_code: int, payload: dict, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": CORS_HEADERS + [(b"content-type", b"application/json")] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _chat(scope, receive, send, stream: bool):
+    endpoint = "chat_stream" if stream else "chat"
+    trace = tracing.start_trace()
+    data, error = await _read_json_object(receive)
+    if error is not None:
+        tracing.finish_trace(trace, endpoint, "error")
+        return await _send_json(send, 400, {"error": error})
+
+    user_message = data.get("message", "")
+    if not user_message:
+        tracing.finish_trace(trace, endpoint, "error")
+        return await _send_json(send, 400, {"error": "Message is required"})
+    if not isinstance(user_message, str):
+        tracing.finish_trace(trace, endpoint, "error")
+        return await _send_json(send, 400, {"error": "Message must be a string"})
+
+    try:
+        agent = await get_async_agent()
+    except Exception as e:
+        tracing.finish_trace(trace, endpoint, "error")
+        return await _send_json(send, 500, {"error": str(e)})
+
+    bypass = _cache_bypassed(scope)
+    cached = None if bypass else await asyncio.to_thread(agent.cached_messages, user_message)
+    cache_header = (config.CACHE_HEADER.lower().encode("latin-1"), b"HIT" if cached is not None else b"MISS")
+    outcome = "hit" if cached is not None else "miss"
+
+    if not stream:
+        try:
+            messages = cached if cached is not None else await agent.run_agent_async(user_message, use_cache=False, coalesce=not bypass)
+        except Exception as e:
+            tracing.finish_trace(trace, endpoint, "error")
+            return await _send_json(send, 500, {"error": str(e)})
+        if cached is None:
+            outcome = run_outcome(trace)
+            cache_header = (cache_header[0], outcome.upper().encode("latin-1"))
+        return await _send_json(send, 200, {"messages": messages, "trace": tracing.finish_trace(trace, endpoint, outcome)}, headers=[cache_header])
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": CORS_HEADERS + [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            cache_header,
+        ],
+    })
+    try:
+        async def cached_stream():
+            for message in cached:
+                yield message
+
+        messages = cached_stream() if cached is not None else agent.run_agent_stream_async(user_message, coalesce=not bypass)
+        async for message in messages:
+            frame = f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+            await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+        if cached is None:
+            outcome = run_outcome(trace)
+    except Exception as e:
+        outcome = "error"
+        error_message = {"role": "assistant", "type": "error", "content": f"An error occurred: {str(e)}"}
+        frame = f"data: {json.dumps(error_message)}\n\n"
+        await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+    frame = f"event: trace\ndata: {json.dumps(tracing.finish_trace(trace, endpoint, outcome))}\n\n"
+    await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b"event: done\ndata: {}\n\n"})
+
+async def _batch(scope, receive, send):
+    """Runs many goals at once, streaming one JSON line per goal (see api.py's /api/batch)."""
+    data, error = await _read_json_object(receive)
+    if error is not None:
+        return await _send_json(send, 400, {"error": error})
+    try:
+        goals, concurrency, rate_per_minute = parse_batch_request(data)
+    except BatchRequestError as e:
+        return await _send_json(send, 400, {"error": str(e)})
+
+    try:
+        agent = await get_async_agent()
+    except Exception as e:
+        return await _send_json(send, 500, {"error": str(e)})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": CORS_HEADERS + [
+            (b"content-type", b"application/x-ndjson"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+    async for item in run_batch_async(agent, goals, concurrency, rate_per_minute, not _cache_bypassed(scope)):
+        line = json.dumps(item, ensure_ascii=False) + "\n"
+        await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+async def _preview(receive, send):
+    """Runs the agent's cached answer to a goal in the headless sandbox (see api.py's /api/preview)."""
+    data, error = await _read_json_object(receive)
+    if error is not None:
+        return await _send_json(send, 400, {"error": error})
+
+    goal = data.get("goal")
+    if not isinstance(goal, str) or not goal.strip():
+        return await _send_json(send, 400, {"error": "goal is required and must be a string"})
+
+    try:
+        agent = await get_async_agent()
+        code = final_answer_program(await asyncio.to_thread(agent.cached_messages, goal))
+        if code is None:
+            return await _send_json(send, 404, {"error": "No answer to preview for this goal; ask the agent first"})
+        # Waiting on the worker blocks, so it happens in a thread
+        result = await asyncio.to_thread(lambda: sandbox_pool().run(code))
+        await _send_json(send, 200, preview_payload(result))
+    except Exception as e:
+        await _send_json(send, 500, {"error": str(e)})
+
+async def _status(send, instance_state: str):
+    try:
+        agent = await get_async_agent()
+        function_count = await asyncio.to_thread(agent.retriever.count)
+        await _send_json(send, 200, {
+            "status": "ready",
+            "functions_loaded": function_count,
+            "data_source": "du_draw_functions_data.py",
+            "retriever_mode": agent.retriever.mode,
+            "instance": INSTANCE.report(instance_state, agent.retriever.warm_start),
+            **{f"{cache}_cache": stats for cache, stats in agent.cache_stats().items()},
+            "single_flight": agent.single_flight.stats(),
+            "upstream": agent.chat.limiter.stats()
+        })
+    except Exception as e:
+        await _send_json(send, 500, {"status": "error", "error": str(e)})
+
+async def _metrics(send):
+    if _agent is not None:
+        tracing.update_cache_gauges(_agent.cache_stats())
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": CORS_HEADERS + [(b"content-type", b"text/plain; version=0.0.4")],
+    })
+    await send({"type": "http.response.body", "body": tracing.METRICS.render().encode("utf-8")})
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"].rstrip("/")
+    instance_state = INSTANCE.begin_request() if method != "OPTIONS" else None
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 200, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+    elif method == "POST" and path == "/api/chat":
+        await _chat(scope, receive, send, stream=False)
+    elif method == "POST" and path == "/api/chat/stream":
+        await _chat(scope, receive, send, stream=True)
+    elif method == "POST" and path == "/api/batch":
+        await _batch(scope, receive, send)
+    elif method == "POST" and path == "/api/preview":
+        await _preview(receive, send)
+    elif method == "GET" and path == "/api/status":
+        await _status(send, instance_state)
+    elif method == "GET" and path == "/api/metrics":
+        await _metrics(send)
+    else:
+        await _send_json(send, 404, {"error": "Not found"})
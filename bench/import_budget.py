@@ -0,0 +1,153 @@
+"""
+Cold-import budget for the Netlify chat function.
+
+Imports netlify/functions/chat.py in a fresh interpreter under `python -X importtime`,
+then sends it a preflight, two invalid requests and a cached prompt. Exits with status 1
+when the cold import goes over --budget-ms, when a preflight or validation request goes
+over --request-budget-ms, or when any of these requests imported openai, chromadb, numpy or tiktoken:
+
+    python bench/import_budget.py
+    python bench/import_budget.py --budget-ms 20 --top 15 --json import-budget.json
+
+The agent's eager creation at import (AGENT_EAGER_INIT, see dudraw_companion/warm_start.py)
+is turned off unless --eager is given; the eager import then is reported, but may import
+the heavy modules.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NETLIFY_FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "netlify", "functions")
+HEAVY_MODULES = ("openai", "chromadb", "numpy", "tiktoken")
+
+# Runs in the child interpreter; prints its measurements as JSON on the last stdout line
+CHILD_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+import chat
+import_ms = (time.perf_counter() - start) * 1000
+
+def timed(event):
+    start = time.perf_counter()
+    response = chat.handler(event, None)
+    return response["statusCode"], (time.perf_counter() - start) * 1000
+
+requests = {
+    "preflight": timed({"httpMethod": "OPTIONS"}),
+    "invalid_json": timed({"httpMethod": "POST", "body": "{not json"}),
+    "missing_message": timed({"httpMethod": "POST", "body": "{}"}),
+}
+start = time.perf_counter()
+answer_cache = chat.get_answer_cache()
+answer_cache_ms = (time.perf_counter() - start) * 1000
+answer_cache.store("draw a red circle", [{"role": "user", "content": "draw a red circle"}, {"role": "assistant", "type": "final", "content": "cached"}])
+requests["cache_hit"] = timed({"httpMethod": "POST", "body": json.dumps({"message": "Draw a red circle"})})
+print(json.dumps({
+    "import_ms": import_ms,
+    "answer_cache_ms": answer_cache_ms,
+    "requests": requests,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str):
+    """
+    Returns {module: (self_us, cumulative_us)} from `-X importtime` output, skipping the
+    modules the interpreter imports at startup (everything up to and including `site`).
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if name.strip() == "site" and not name.startswith("  "):
+            modules = {}
+            continue
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(python: str, scratch_dir: str, eager: bool = False):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env["AGENT_EAGER_INIT"] = "auto" if eager else "false"
+    # Keep the function's /tmp caches out of the measurement
+    env["RESPONSE_CACHE_BACKEND"] = "memory"
+    env["EMBEDDING_CACHE_PATH"] = os.path.join(scratch_dir, "embedding_cache.sqlite3")
+    result = subprocess.run([python, "-X", "importtime", "-c", CHILD_SCRIPT], cwd=NETLIFY_FUNCTIONS_DIR,
+                            env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"Child interpreter failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=25, help="maximum median cold-import time of the chat function")
+    parser.add_argument("--request-budget-ms", type=float, default=10, help="maximum median time of preflight and validation requests")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to measure; medians are reported")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules (self time) to list")
+    parser.add_argument("--eager", action="store_true", help="measure with AGENT_EAGER_INIT=auto (eager creation when the snapshot makes it cheap)")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--json", help="also write the report to this path")
+    args = parser.parse_args(argv)
+
+    runs = []
+    modules = {}
+    with tempfile.TemporaryDirectory(prefix="dudraw-import-") as scratch_dir:
+        for _ in range(args.runs):
+            measurement, modules = run_once(args.python, scratch_dir, args.eager)
+            runs.append(measurement)
+
+    import_ms = statistics.median(run["import_ms"] for run in runs)
+    answer_cache_ms = statistics.median(run["answer_cache_ms"] for run in runs)
+    request_ms = {name: statistics.median(run["requests"][name][1] for run in runs) for name in runs[0]["requests"]}
+    heavy_modules = sorted({name for run in runs for name in run["heavy_modules"]})
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"cold import took {import_ms:.1f} ms (budget {args.budget_ms} ms)")
+    for name in ("preflight", "invalid_json", "missing_message"):
+        if request_ms[name] > args.request_budget_ms:
+            failures.append(f"{name} took {request_ms[name]:.2f} ms (budget {args.request_budget_ms} ms)")
+    for name, (status_code, _) in runs[0]["requests"].items():
+        expected = 200 if name in ("preflight", "cache_hit") else 400
+        if status_code != expected:
+            failures.append(f"{name} returned HTTP {status_code}, expected {expected}")
+    if heavy_modules and not args.eager:
+        failures.append(f"heavy modules imported without running the agent: {', '.join(heavy_modules)}")
+
+    print(f"Cold import of netlify/functions/chat.py: {import_ms:.1f} ms (budget {args.budget_ms} ms, median of {args.runs})")
+    print(f"  {'answer cache':<16} {answer_cache_ms:8.3f} ms to create (first cacheable request only)")
+    for name, elapsed in request_ms.items():
+        print(f"  {name:<16} {elapsed:8.3f} ms")
+    print("Slowest modules imported by the function, by self time:")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {self_us / 1000:7.2f} ms self {cumulative_us / 1000:8.2f} ms cumulative  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "import_ms": import_ms,
+                "budget_ms": args.budget_ms,
+                "answer_cache_ms": answer_cache_ms,
+                "request_ms": request_ms,
+                "heavy_modules": heavy_modules,
+                "slowest_modules": [{"module": name, "self_us": s, "cumulative_us": c} for name, (s, c) in slowest],
+                "failures": failures
+            }, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
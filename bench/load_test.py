@@ -0,0 +1,323 @@
+"""
+Load driver for the DuDraw Code Companion backends.
+
+Runs a fixed number of requests at fixed concurrency against one target and reports
+latency percentiles, throughput, RSS and CPU time per request. Unless --openai-base-url
+is given, a local stub OpenAI server (bench/stub_openai.py) is started in-process, so
+runs are deterministic and free:
+
+    python bench/load_test.py --target flask --requests 200 --concurrency 8
+    python bench/load_test.py --target netlify --requests 50 --concurrency 4
+    python bench/load_test.py --target retriever --requests 2000 --concurrency 8
+    python bench/load_test.py --target cold-start --requests 5
+    python bench/load_test.py --target url --url http://localhost:5000/api/chat --server-pid 1234
+
+Targets:
+    flask       POST /api/chat through the Flask app in this process (run_agent end to end)
+    netlify     the Netlify chat function's handler(event, context) in this process
+    retriever   DuDrawFunctionRetriever.retrieve_functions in this process
+    cold-start  a fresh interpreter per request: import the Netlify function and answer one request
+    url         POST to an already running server (point its OPENAI_BASE_URL at the stub yourself)
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+NETLIFY_FUNCTIONS_DIR = os.path.join(REPO_DIR, "netlify", "functions")
+sys.path.insert(0, REPO_DIR)
+
+from stub_openai import StubOpenAIServer
+
+DEFAULT_PROMPTS = [
+    "Draw a red circle in the center of the canvas",
+    "Make a blue square with a black outline",
+    "Draw a house with a triangle roof",
+    "Animate a bouncing ball",
+    "Draw a smiley face",
+    "Draw a green rectangle in the bottom left corner",
+    "Write my name in large text",
+    "Draw a target made of concentric circles"
+]
+
+# Natural-language queries, so retrieval goes past the exact identifier index
+RETRIEVER_QUERIES = [
+    "make the drawing window bigger", "draw a round shape", "change the drawing color",
+    "solid box", "write words on the canvas", "redraw every frame for animation",
+    "react when a key is pressed", "where is the mouse", "shape with many corners",
+    "paint the whole background"
+]
+
+
+def percentile(sorted_values, fraction: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def current_rss_mb(pid: str = "self"):
+    """Resident set size of a process in MB (Linux /proc), or None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_cpu_seconds(pid: str):
+    """User + system CPU time of another process (Linux /proc), or None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def isolate_environment(openai_base_url: str = None):
+    """
+    Keeps every on-disk cache (Chroma, SQLite embedding and response caches) in a scratch
+    directory. With a stub openai_base_url the catalog artifact is isolated too, so stub
+    vectors never end up in the real caches; without one the real artifact is reused.
+    """
+    workdir = tempfile.mkdtemp(prefix="dudraw-bench-")
+    if openai_base_url:
+        os.environ["OPENAI_BASE_URL"] = openai_base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ["CATALOG_EMBEDDINGS_DIR"] = os.path.join(workdir, "catalog_embeddings")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "response_cache.sqlite3")
+    os.chdir(workdir)
+    return workdir
+
+
+# --- Targets ---
+# Each target returns a callable that performs request number i and returns True on success
+
+def flask_target(args):
+    import api
+    client = api.app.test_client()
+    headers = {} if args.allow_cache else {api.CACHE_HEADER: "bypass"}
+
+    def call(i):
+        response = client.post("/api/chat", json={"message": args.prompts[i % len(args.prompts)]}, headers=headers)
+        return response.status_code == 200 and response.get_json()["messages"][-1]["type"] == "final"
+    return call
+
+
+def netlify_target(args):
+    sys.path.insert(0, NETLIFY_FUNCTIONS_DIR)
+    from chat import handler
+
+    def call(i):
+        event = {"httpMethod": "POST", "body": json.dumps({"message": args.prompts[i % len(args.prompts)]})}
+        response = handler(event, None)
+        return response["statusCode"] == 200 and json.loads(response["body"])["messages"][-1]["type"] == "final"
+    return call
+
+
+def retriever_target(args):
+    from dudraw_companion.retriever import DuDrawFunctionRetriever
+    retriever = DuDrawFunctionRetriever()
+
+    def call(i):
+        return bool(retriever.retrieve_functions(RETRIEVER_QUERIES[i % len(RETRIEVER_QUERIES)]))
+    return call
+
+
+def url_target(args):
+    headers = {"Content-Type": "application/json"}
+    if not args.allow_cache:
+        headers["X-DuDraw-Cache"] = "bypass"
+
+    def call(i):
+        payload = json.dumps({"message": args.prompts[i % len(args.prompts)]}).encode("utf-8")
+        request = urllib.request.Request(args.url, data=payload, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=args.timeout) as response:
+            return response.status == 200 and json.loads(response.read())["messages"][-1]["type"] == "final"
+    return call
+
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {functions_dir!r})
+from chat import handler
+imported = time.perf_counter()
+response = handler({{"httpMethod": "POST", "body": json.dumps({{"message": {prompt!r}}})}}, None)
+done = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - start) * 1000, "first_request_ms": (done - imported) * 1000, "ok": response["statusCode"] == 200}}))
+"""
+
+
+def run_cold_start(args):
+    """Sequentially starts fresh interpreters; concurrency does not apply."""
+    latencies, import_times, first_request_times, failures = [], [], [], 0
+    wall_start = time.perf_counter()
+    for i in range(args.requests):
+        script = COLD_START_SCRIPT.format(functions_dir=NETLIFY_FUNCTIONS_DIR, prompt=args.prompts[i % len(args.prompts)])
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=os.environ.copy())
+        latencies.append(time.perf_counter() - start)
+        try:
+            measured = json.loads(result.stdout.strip().splitlines()[-1])
+            import_times.append(measured["import_ms"])
+            first_request_times.append(measured["first_request_ms"])
+            failures += not measured["ok"]
+        except (IndexError, ValueError):
+            print(result.stderr, file=sys.stderr)
+            failures += 1
+    wall_seconds = time.perf_counter() - wall_start
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report = summarize(latencies, failures, wall_seconds, (usage.ru_utime + usage.ru_stime) / max(1, args.requests))
+    report["peak_rss_mb"] = round(usage.ru_maxrss / 1024, 1)
+    report["import_ms_p50"] = round(percentile(sorted(import_times), 0.50), 1)
+    report["first_request_ms_p50"] = round(percentile(sorted(first_request_times), 0.50), 1)
+    return report
+
+
+def run_load(call, args):
+    """Runs args.warmup untimed requests, then args.requests timed requests at args.concurrency."""
+    for i in range(args.warmup):
+        call(i)
+
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def timed(i):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception as e:
+            print(f"Request {i} failed: {e}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            failures += not ok
+
+    server_cpu_start = process_cpu_seconds(args.server_pid) if args.server_pid else None
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(timed, range(args.requests)))
+    wall_seconds = time.perf_counter() - wall_start
+
+    if args.target == "url":
+        if server_cpu_start is None:
+            cpu_per_request, rss_mb = None, None
+        else:
+            cpu_per_request = (process_cpu_seconds(args.server_pid) - server_cpu_start) / args.requests
+            rss_mb = current_rss_mb(args.server_pid)
+    else:
+        # The in-process stub server's own CPU is included; it is small next to the agent's
+        cpu_per_request = (time.process_time() - cpu_start) / args.requests
+        rss_mb = current_rss_mb()
+
+    report = summarize(latencies, failures, wall_seconds, cpu_per_request)
+    report["rss_mb"] = round(rss_mb, 1) if rss_mb is not None else None
+    if args.target != "url":
+        report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+def summarize(latencies, failures: int, wall_seconds: float, cpu_per_request):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        "cpu_ms_per_request": round(cpu_per_request * 1000, 3) if cpu_per_request is not None else None
+    }
+
+
+TARGETS = {
+    "flask": flask_target,
+    "netlify": netlify_target,
+    "retriever": retriever_target,
+    "url": url_target
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=sorted(TARGETS) + ["cold-start"], default="flask")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests sent first (agent init, caches)")
+    parser.add_argument("--prompts", help="JSON file with a list of prompts to cycle through")
+    parser.add_argument("--allow-cache", action="store_true", help="let the response cache answer repeated prompts")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/chat", help="endpoint for --target url")
+    parser.add_argument("--server-pid", help="PID of the server behind --url, to report its RSS and CPU")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--openai-base-url", help="use this OpenAI-compatible server instead of starting the stub")
+    parser.add_argument("--script", help="JSON file with the stub's scripted agent steps")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--embedding-ms", type=float, default=100)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    if args.prompts:
+        with open(args.prompts, encoding="utf-8") as f:
+            args.prompts = json.load(f)
+    else:
+        args.prompts = DEFAULT_PROMPTS
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    stub = None
+    openai_base_url = args.openai_base_url
+    if openai_base_url is None and args.target != "url":
+        script = None
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                script = json.load(f)
+        stub = StubOpenAIServer(script=script, first_token_ms=args.first_token_ms, token_ms=args.token_ms,
+                                embedding_ms=args.embedding_ms).start()
+        openai_base_url = stub.base_url
+    if args.target != "url":
+        workdir = isolate_environment(openai_base_url)
+        print(f"Backends use {openai_base_url}; scratch data in {workdir}")
+
+    if args.target == "cold-start":
+        report = run_cold_start(args)
+    else:
+        report = run_load(TARGETS[args.target](args), args)
+
+    report = {
+        "target": args.target,
+        "concurrency": 1 if args.target == "cold-start" else args.concurrency,
+        **report
+    }
+    if stub is not None:
+        report["stub_requests"] = dict(stub.request_counts)
+        stub.shutdown()
+
+    print(json.dumps(report, indent=2))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Retrieval quality and latency benchmark over a labeled query set.
+
+Runs every query in bench/retrieval_queries.json (each labeled with the expected
+DU_DRAW_FUNCTIONS ids) against each retriever configuration and reports recall@k, MRR,
+per-query latency and the token size of the observation the LLM receives
+(_format_retrieved_tools_for_llm_response). Results are written to JSON so the
+latency/quality trade-off can be tracked over time:
+
+    OPENAI_API_KEY=sk-... python bench/retrieval_benchmark.py
+    python bench/retrieval_benchmark.py --stub --configs lexical identifier
+
+With --stub (or without OPENAI_API_KEY) the embeddings come from the local stub server:
+latency and token numbers stay meaningful, dense quality numbers do not.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from load_test import isolate_environment, percentile
+from stub_openai import StubOpenAIServer
+
+# name -> (retriever backend, retriever mode, use the identifier fast path)
+CONFIGURATIONS = {
+    "identifier": (None, None, True),
+    "lexical": ("numpy", "lexical", False),
+    "dense-numpy": ("numpy", "dense", False),
+    "dense-chroma": ("chroma", "dense", False),
+    "hybrid-numpy": ("numpy", "hybrid", False),
+    "hybrid-numpy+identifier": ("numpy", "hybrid", True)
+}
+
+
+def token_counter(model_name: str):
+    """Returns (count_tokens, name): tiktoken when installed, otherwise ~4 characters per token."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return (lambda text: len(encoding.encode(text))), "tiktoken"
+    except ImportError:
+        return (lambda text: math.ceil(len(text) / 4)), "heuristic"
+
+
+def score(retrieved_ids, expected_ids, k_values):
+    """recall@k for each k and the reciprocal rank of the first expected id."""
+    expected = set(expected_ids)
+    recalls = {k: len(expected & set(retrieved_ids[:k])) / len(expected) for k in k_values}
+    reciprocal_rank = next((1.0 / (rank + 1) for rank, function_id in enumerate(retrieved_ids) if function_id in expected), 0.0)
+    return recalls, reciprocal_rank
+
+
+def make_search(name: str, scratch_dir: str):
+    """Builds the search function of one configuration, with its own empty embedding cache."""
+    from dudraw_companion.retriever import DuDrawFunctionRetriever
+    from dudraw_companion.warm_start import catalog_indexes
+    backend, mode, fast_path = CONFIGURATIONS[name]
+    if backend is None:
+        identifier_index = catalog_indexes()[2]
+        return lambda query, n_results: identifier_index.query(query, n_results) or []
+
+    cache_path = os.path.join(scratch_dir, f"embedding_cache-{name}.sqlite3")
+    retriever = DuDrawFunctionRetriever(backend=backend, mode=mode, embedding_cache_path=cache_path)
+    if fast_path:
+        return lambda query, n_results: retriever.query_many([query], n_results)[0]
+    return lambda query, n_results: retriever._search_many([query], n_results)[0]
+
+
+def run_configuration(name: str, labeled_queries, n_results: int, repeats: int, scratch_dir: str, count_tokens):
+    from dudraw_companion.retriever import DuDrawFunctionRetriever
+    search = make_search(name, scratch_dir)
+    # The observation text does not depend on the backend; an offline retriever formats it
+    formatter = DuDrawFunctionRetriever(mode="lexical")._format_retrieved_tools_for_llm_response
+    k_values = sorted({1, 3, n_results})
+
+    per_query = []
+    cold_latencies = []
+    warm_latencies = []
+    for item in labeled_queries:
+        # The first pass pays for query embeddings; later passes hit the embedding cache
+        for attempt in range(repeats):
+            start = time.perf_counter()
+            results = search(item["query"], n_results)
+            elapsed = time.perf_counter() - start
+            (cold_latencies if attempt == 0 else warm_latencies).append(elapsed)
+
+        retrieved_ids = [meta["id"] for meta in results]
+        recalls, reciprocal_rank = score(retrieved_ids, item["expected"], k_values)
+        per_query.append({
+            "query": item["query"],
+            "expected": item["expected"],
+            "retrieved": retrieved_ids,
+            "recall": {f"@{k}": value for k, value in recalls.items()},
+            "reciprocal_rank": reciprocal_rank,
+            "tokens": count_tokens(formatter(results))
+        })
+
+    count = len(per_query)
+    cold = sorted(cold_latencies)
+    warm = sorted(warm_latencies)
+    summary = {f"recall@{k}": round(sum(q["recall"][f"@{k}"] for q in per_query) / count, 4) for k in k_values}
+    summary.update({
+        "mrr": round(sum(q["reciprocal_rank"] for q in per_query) / count, 4),
+        "answered": sum(1 for q in per_query if q["retrieved"]),
+        "cold_latency_ms_p50": round(percentile(cold, 0.50) * 1000, 3),
+        "cold_latency_ms_p95": round(percentile(cold, 0.95) * 1000, 3),
+        "latency_ms_p50": round(percentile(warm, 0.50) * 1000, 3) if warm else None,
+        "latency_ms_p95": round(percentile(warm, 0.95) * 1000, 3) if warm else None,
+        "tokens_mean": round(sum(q["tokens"] for q in per_query) / count, 1),
+        "tokens_max": max(q["tokens"] for q in per_query)
+    })
+    return summary, per_query
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(BENCH_DIR, "retrieval_queries.json"))
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument("--n-results", type=int, default=6, help="top-k passed to the retriever (n_results)")
+    parser.add_argument("--repeats", type=int, default=3, help="passes per query; the first is reported as cold")
+    parser.add_argument("--stub", action="store_true", help="use the local stub server for embeddings")
+    parser.add_argument("--per-query", action="store_true", help="include every query's results in the JSON")
+    parser.add_argument("--output", help="JSON report path (default: bench/results/retrieval-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.queries, encoding="utf-8") as f:
+        labeled_queries = json.load(f)
+    output = os.path.abspath(args.output or os.path.join(BENCH_DIR, "results", time.strftime("retrieval-%Y%m%d-%H%M%S.json")))
+
+    stub = None
+    if args.stub or not os.environ.get("OPENAI_API_KEY"):
+        stub = StubOpenAIServer().start()
+        print(f"Using stub embeddings from {stub.base_url}: dense quality numbers are not meaningful")
+    scratch_dir = isolate_environment(stub.base_url if stub else None)
+
+    # Imported after the environment is set up, since the configuration is read at import time
+    from dudraw_companion import config
+    from dudraw_companion.catalog_artifact import catalog_hash
+    count_tokens, counter_name = token_counter(config.LLM_MODEL_NAME)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "catalog_hash": catalog_hash(config.EMBEDDING_MODEL_NAME),
+        "stub_embeddings": stub is not None,
+        "n_results": args.n_results,
+        "queries": len(labeled_queries),
+        "token_counter": counter_name,
+        "results": {}
+    }
+    for name in args.configs:
+        summary, per_query = run_configuration(name, labeled_queries, args.n_results, args.repeats, scratch_dir, count_tokens)
+        report["results"][name] = summary
+        if args.per_query:
+            summary["per_query"] = per_query
+        print(f"{name:<26} recall@{args.n_results}={summary[f'recall@{args.n_results}']:.3f} mrr={summary['mrr']:.3f} "
+              f"p50={summary['latency_ms_p50']}ms cold_p50={summary['cold_latency_ms_p50']}ms tokens={summary['tokens_mean']}")
+
+    if stub is not None:
+        stub.shutdown()
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+A local stand-in for the OpenAI chat-completions and embeddings endpoints.
+
+Replays a scripted ReAct sequence (tool calls, then a final answer) with configurable
+latency, so the agent loop can be benchmarked without API costs or network jitter:
+
+    python bench/stub_openai.py --port 8765 --first-token-ms 300 --token-ms 5
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python api.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One entry per agent step; the step is chosen by how many assistant turns the request already contains
+DEFAULT_SCRIPT = [
+    {
+        "content": "Thought: I need the exact syntax for the canvas, colors and shapes.",
+        "tool_calls": [
+            {"name": "retrieve_dudraw_functions", "arguments": {"query": "set canvas size"}},
+            {"name": "retrieve_dudraw_functions", "arguments": {"query": "draw circle"}}
+        ]
+    },
+    {
+        "content": "Thought: I also need the pen color.",
+        "tool_calls": [
+            {"name": "retrieve_dudraw_functions", "arguments": {"query": "set color"}}
+        ]
+    },
+    {
+        "content": (
+            "```python\n"
+            "# Program Description: Draws a red circle in the center of the canvas\n"
+            "# Author: DuDraw Code Companion\n"
+            "# Date: Generated code\n\n"
+            "# Import required libraries\n"
+            "import dudraw\n\n"
+            "# Set up a 500x500 canvas\n"
+            "dudraw.set_canvas_size(500, 500)\n"
+            "# Draw the circle in red\n"
+            "dudraw.set_pen_color(dudraw.RED)\n"
+            "dudraw.filled_circle(0.5, 0.5, 0.2)\n"
+            "# Display the drawing\n"
+            "dudraw.show(0)\n"
+            "```\n"
+            "---\n"
+            "**Explanation:**\n"
+            "- The canvas is set up, the pen color is set to red and a filled circle is drawn in the center."
+        )
+    }
+]
+
+
+def stub_embedding(text: str, dimensions: int):
+    """Deterministic unit vector derived from the text, so equal texts always embed identically."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector]
+
+
+def _chunk_text(text: str, size: int = 16):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status_code: int, payload: dict, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        config = self.server.config
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.count_request(self.path)
+
+        if config["error_rate"] and self.server.rng.random() < config["error_rate"]:
+            return self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}}, {"retry-after-ms": "200"})
+
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat_completions(body)
+        self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _rate_limit_headers(self):
+        return {
+            "x-ratelimit-limit-requests": str(self.server.config["rpm_limit"]),
+            "x-ratelimit-remaining-requests": str(self.server.config["rpm_limit"] - 1),
+            "x-ratelimit-reset-requests": "60ms",
+            "x-ratelimit-limit-tokens": str(self.server.config["tpm_limit"]),
+            "x-ratelimit-remaining-tokens": str(self.server.config["tpm_limit"] - 1000),
+            "x-ratelimit-reset-tokens": "60ms"
+        }
+
+    def _embeddings(self, body):
+        config = self.server.config
+        time.sleep(config["embedding_ms"] / 1000)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self._send_json(200, {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(str(text), config["dimensions"])}
+                for i, text in enumerate(texts)
+            ],
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        }, self._rate_limit_headers())
+
+    def _chat_completions(self, body):
+        config = self.server.config
+        script = config["script"]
+        messages = body.get("messages", [])
+        step = min(sum(1 for message in messages if message.get("role") == "assistant"), len(script) - 1)
+        turn = script[step]
+
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        cached_tokens = (len(str(messages[0].get("content", ""))) // 4) // 128 * 128 if messages else 0
+        completion_tokens = len(turn.get("content", "")) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        tool_calls = [
+            {
+                "id": f"call_{step}_{i}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+            }
+            for i, call in enumerate(turn.get("tool_calls", []))
+        ]
+
+        time.sleep(config["first_token_ms"] / 1000)
+        if not body.get("stream"):
+            time.sleep(config["token_ms"] * len(_chunk_text(turn.get("content", ""))) / 1000)
+            message = {"role": "assistant", "content": turn.get("content")}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return self._send_json(200, {
+                "id": f"chatcmpl-stub-{step}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                "usage": usage
+            }, self._rate_limit_headers())
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in self._rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        def send_chunk(delta, finish_reason=None, include_usage=False):
+            chunk = {
+                "id": f"chatcmpl-stub-{step}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [] if include_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if include_usage:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for piece in _chunk_text(turn.get("content", "")):
+            send_chunk({"role": "assistant", "content": piece})
+            time.sleep(config["token_ms"] / 1000)
+        for i, tool_call in enumerate(tool_calls):
+            send_chunk({"tool_calls": [{"index": i, "id": tool_call["id"], "type": "function", "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            send_chunk({"tool_calls": [{"index": i, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+        send_chunk({}, finish_reason="tool_calls" if tool_calls else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send_chunk({}, include_usage=True)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """The stub server; start() runs it in a background thread for in-process benchmarks."""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, script=None, first_token_ms: float = 0, token_ms: float = 0,
+                 embedding_ms: float = 0, dimensions: int = 1536, error_rate: float = 0.0, seed: int = 0,
+                 rpm_limit: int = 10000, tpm_limit: int = 10000000):
+        super().__init__((host, port), StubOpenAIHandler)
+        self.config = {
+            "script": script or DEFAULT_SCRIPT,
+            "first_token_ms": first_token_ms,
+            "token_ms": token_ms,
+            "embedding_ms": embedding_ms,
+            "dimensions": dimensions,
+            "error_rate": error_rate,
+            "rpm_limit": rpm_limit,
+            "tpm_limit": tpm_limit
+        }
+        self.rng = random.Random(seed)
+        self.request_counts = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count_request(self, path: str):
+        with self._counts_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON file with the scripted agent steps (defaults to a 3-step run)")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="delay before the first chunk of each completion")
+    parser.add_argument("--token-ms", type=float, default=5, help="delay between streamed chunks")
+    parser.add_argument("--embedding-ms", type=float, default=100, help="latency of each embeddings request")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding size (1536 matches text-embedding-3-small)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    server = StubOpenAIServer(args.host, args.port, script, args.first_token_ms, args.token_ms,
+                              args.embedding_ms, args.dimensions, args.error_rate, args.seed)
+    print(f"Stub OpenAI API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
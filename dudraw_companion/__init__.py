@@ -0,0 +1,32 @@
+"""
+DuDraw Code Companion core: the retriever, the agent, its tools and the system prompt.
+
+The Flask (api.py), ASGI (asgi.py), Netlify (netlify/functions/chat.py) and Streamlit
+(main_app.py) apps are thin adapters around this package.
+
+Importing the package is cheap: the names below are resolved on first access, and heavy
+dependencies (openai, chromadb, numpy) are only imported by the code paths that use them.
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "AgentRun": "agent",
+    "DuDrawAgent": "agent",
+    "AsyncDuDrawAgent": "async_agent",
+    "DuDrawFunctionRetriever": "retriever",
+    "TOOLS_DEFINITIONS": "tools",
+    "calculate_expression": "tools",
+    "SYSTEM_PROMPT": "prompt",
+    "build_system_prompt": "prompt",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
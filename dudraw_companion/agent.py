@@ -0,0 +1,473 @@
+"""
+The DuDraw ReAct agent: an LLM loop that calls the retriever and calculator tools.
+
+DuDrawAgent holds the shared, read-only state (retriever, caches, system prompt) and is
+safe to use from many concurrent requests; each run's conversation lives in an AgentRun.
+"""
+import json
+import time
+
+from . import config, tracing
+from .answer_cache import AnswerCache
+from .code_validator import CatalogSignatures, repair_request, validate_answer
+from .context_budget import ContextBudget, TokenCounter
+from .pre_retrieval import INJECTED_TOOL_CALL_ID, PreRetrieval, create_pre_retrieval_executor, injected_tool_call
+from .prompt import build_system_prompt
+from .retriever import DuDrawFunctionRetriever
+from .single_flight import SingleFlight
+from .upstream import RateLimitedChat
+from .tools import TOOLS_DEFINITIONS, calculate_expression
+
+# --- Per-request Run Context ---
+class AgentRun:
+    """
+    Holds the conversation history of a single agent run, so concurrent requests never share state.
+    The full history is kept; DuDrawAgent fits it into the context budget before each LLM call.
+
+    The system prompt comes first and is identical for every request, so the provider's prompt
+    cache can reuse it; the user's goal and the run's own turns follow it.
+    """
+    def __init__(self, user_goal: str, system_prompt: str):
+        self.user_goal = user_goal
+        self.conversation_history = [{"role": "system", "content": system_prompt}]
+        self._add_to_history("user", user_goal)
+        # Speculative retrieval of the goal (PRE_RETRIEVAL), or None
+        self.pre_retrieval = None
+
+    def _add_to_history(self, role: str, content: str, tool_calls=None, tool_call_id=None, name=None):
+        """Adds a message to the conversation history, supporting tool calls and responses."""
+        message = {"role": role}
+        if content:
+            message["content"] = content
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        if tool_call_id:
+            message["tool_call_id"] = tool_call_id
+        if name:
+            message["name"] = name
+        self.conversation_history.append(message)
+
+
+# --- Main Agent Class ---
+class DuDrawAgent:
+    """
+    The core Agentic AI system for DuDraw code generation.
+    """
+    def __init__(self, openai_api_key, answer_cache: AnswerCache = None):
+        if not openai_api_key:
+            raise ValueError("OpenAI API Key is required for the agent to function.")
+        # Imported here so importing the package never pays for the OpenAI client
+        import openai
+        # Retries are left to the shared upstream limiter (upstream.py), which also queues calls under the rate limits
+        self.client = openai.OpenAI(api_key=openai_api_key, max_retries=0)
+        self.chat = RateLimitedChat(self.client)
+
+        # Shared, read-only state: safe to use from many concurrent requests.
+        # Per-request state (the conversation history) lives in AgentRun.
+        self.retriever = DuDrawFunctionRetriever()
+        self.system_prompt = build_system_prompt()
+        # Adapters may pass the answer cache they already use to serve hits before the agent exists
+        self.answer_cache = answer_cache if answer_cache is not None else AnswerCache(self.system_prompt)
+        # The semantic cache embeds goals with the retriever's embedding function, so it needs dense retrieval
+        self.answer_cache.enable_semantic_cache(self.retriever.embedding_function)
+
+        self.context_budget = ContextBudget(config.CONTEXT_MAX_INPUT_TOKENS, TokenCounter(config.LLM_MODEL_NAME), TOOLS_DEFINITIONS)
+
+        # Initialize available_tools
+        self.available_tools = {"calculate_expression": calculate_expression}
+        self.available_tools["retrieve_dudraw_functions"] = self.retriever.retrieve_functions
+
+        # Catalog index the code of final answers is checked against (CODE_VALIDATION)
+        self.catalog_signatures = CatalogSignatures()
+
+        # Background threads for speculative retrievals; None when PRE_RETRIEVAL is off
+        self.pre_retrieval_executor = create_pre_retrieval_executor(config.PRE_RETRIEVAL)
+
+        # Concurrent runs of an equivalent goal share one run (SINGLE_FLIGHT_MAX_WAIT_SECONDS)
+        self.single_flight = SingleFlight()
+
+    @staticmethod
+    def _merge_tool_call_deltas(tool_calls: dict, tool_call_deltas):
+        """Tool call names and arguments arrive in streamed fragments keyed by their index."""
+        for tool_call_delta in tool_call_deltas or []:
+            tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            if tool_call_delta.function:
+                if tool_call_delta.function.name:
+                    tool_call["function"]["name"] += tool_call_delta.function.name
+                if tool_call_delta.function.arguments:
+                    tool_call["function"]["arguments"] += tool_call_delta.function.arguments
+
+    @staticmethod
+    def _tool_call_message(function_name: str, function_args: dict):
+        """Message telling the user which tool the agent is calling."""
+        return {
+            "role": "assistant",
+            "type": "tool_call",
+            "content": f"Looking up DuDraw functions: {function_args.get('query', 'N/A')}" if function_name == "retrieve_dudraw_functions" else f"Calculating: {function_args.get('expression', 'N/A')}",
+            "tool_name": function_name,
+            "tool_args": function_args
+        }
+
+    @staticmethod
+    def _retrieval_message(tool_response: str):
+        """Message showing the user (a preview of) the retrieved function information."""
+        return {
+            "role": "assistant",
+            "type": "tool",
+            "content": f"Found DuDraw function information:\n{tool_response[:500]}..." if len(tool_response) > 500 else f"Found DuDraw function information:\n{tool_response}"
+        }
+
+    def _completion_kwargs(self, run: AgentRun, llm_span=None, tool_choice: str = "auto"):
+        """
+        Arguments for one streamed chat completion step of the given run.
+        The conversation is fitted into the context budget; the token counts are noted on llm_span.
+        The tools are always sent, so the cached prompt prefix stays the same; tool_choice="none" turns them off.
+        """
+        messages, context = self.context_budget.fit(run.conversation_history)
+        if llm_span is not None:
+            llm_span.set("context_tokens", context["tokens_after"])
+            for key in ("summarized", "elided", "dropped"):
+                if context[key]:
+                    llm_span.set(f"context_{key}", context[key])
+        if context["over_budget"]:
+            print(f"Context of {context['tokens_after']} tokens exceeds the budget of {context['budget']} tokens")
+        return {
+            "model": config.LLM_MODEL_NAME,
+            "messages": messages,
+            "tools": TOOLS_DEFINITIONS,
+            "tool_choice": tool_choice,
+            "temperature": 0.7,
+            "max_tokens": 1500,
+            "stream": True,
+            # The last chunk then carries the token usage of the whole completion
+            "stream_options": {"include_usage": True}
+        }
+
+    @staticmethod
+    def _upstream_tokens(kwargs: dict, llm_span):
+        """Tokens a completion counts against the tokens-per-minute limit: the prompt plus the completion allowance."""
+        return llm_span.attributes.get("context_tokens", 0) + kwargs["max_tokens"]
+
+    @staticmethod
+    def _record_chunk(llm_span, chunk):
+        """Notes time to first token and the final usage chunk's token counts on the LLM span."""
+        if chunk.choices and "first_token_ms" not in llm_span.attributes:
+            llm_span.set("first_token_ms", round((time.perf_counter() - llm_span.start) * 1000, 2))
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            llm_span.set("prompt_tokens", usage.prompt_tokens)
+            llm_span.set("completion_tokens", usage.completion_tokens)
+            details = getattr(usage, "prompt_tokens_details", None)
+            llm_span.set("cached_tokens", getattr(details, "cached_tokens", 0) or 0)
+
+    def _stream_completion(self, run: AgentRun, step: int = 0, tool_choice: str = "auto"):
+        """
+        Streams one chat completion, yielding a "delta" message for every content token.
+        Returns the assembled (content, tool_calls) once the stream is finished.
+        """
+        with tracing.span("llm", step=step, model=config.LLM_MODEL_NAME) as llm_span:
+            kwargs = self._completion_kwargs(run, llm_span, tool_choice)
+            stream = self.chat.create(kwargs, self._upstream_tokens(kwargs, llm_span), llm_span)
+
+            content_parts = []
+            tool_calls = {}
+            for chunk in stream:
+                self._record_chunk(llm_span, chunk)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield {"role": "assistant", "type": "delta", "content": delta.content}
+                self._merge_tool_call_deltas(tool_calls, delta.tool_calls)
+
+        return "".join(content_parts), [tool_calls[index] for index in sorted(tool_calls)]
+
+    def _validate_answer(self, content: str):
+        """
+        Checks the code blocks of an answer against the catalog (see code_validator.py). With
+        SANDBOX_VERIFY, code without catalog errors is also run in the preview sandbox: a runtime
+        error is added to the diagnostics, and the run's result is kept as report["preview"].
+        """
+        with tracing.span("code_validation") as validation_span:
+            report = validate_answer(content, self.catalog_signatures)
+            validation_span.set("errors", report["errors"])
+        if config.SANDBOX_VERIFY and report["blocks"] and not report["errors"]:
+            from .sandbox import program_from_answer, sandbox_pool
+            result = sandbox_pool().run(program_from_answer(content))
+            report["preview"] = result
+            # Timeouts and a busy pool say nothing about the program, so only these count as errors
+            if result["status"] in ("error", "cpu_limit", "memory_limit"):
+                report["diagnostics"].append({
+                    "code": "runtime-error",
+                    "line": result.get("line") or 0,
+                    "column": 0,
+                    "block": 0,
+                    "name": None,
+                    "message": f"Running the program failed: {result['error']}"
+                })
+                report["errors"] += 1
+        return report
+
+    def _request_repair(self, run: AgentRun, report: dict):
+        """
+        Asks for a fix of exactly the errors in report: adds the repair request to the run's history
+        and returns the message telling the user about it.
+        """
+        run._add_to_history("user", repair_request(report["diagnostics"], self.catalog_signatures))
+        errors = report["errors"]
+        return {
+            "role": "assistant",
+            "type": "thought",
+            "content": f"Found {errors} problem{'s' if errors != 1 else ''} in the code against the DuDraw catalog; fixing {'them' if errors != 1 else 'it'}."
+        }
+
+    def _final_message(self, content: str, report: dict = None, repaired_content: str = None):
+        """
+        The final message. When a repair was attempted, the repaired answer is used only if it
+        has fewer catalog errors than the original.
+        """
+        repaired = False
+        if repaired_content:
+            repaired_report = self._validate_answer(repaired_content)
+            if repaired_report["errors"] < report["errors"]:
+                content, report, repaired = repaired_content, repaired_report, True
+        message = {"role": "assistant", "type": "final", "content": content}
+        if report is not None:
+            message["validation"] = {"errors": report["errors"], "diagnostics": report["diagnostics"], "repaired": repaired}
+            if "preview" in report:
+                from .sandbox import preview_payload
+                message["preview"] = preview_payload(report["preview"])
+        return message
+
+    def _checked_final(self, run: AgentRun, content: str, step: int = 0):
+        """
+        Yields the final message for the answer in content, after checking its code against the
+        catalog (CODE_VALIDATION). In "repair" mode, errors get one more LLM call asking for a fix
+        of just those errors; its tokens are streamed as "delta" messages.
+        """
+        if config.CODE_VALIDATION == "off":
+            yield self._final_message(content)
+            return
+        report = self._validate_answer(content)
+        if not report["errors"] or config.CODE_VALIDATION != "repair":
+            yield self._final_message(content, report)
+            return
+        yield self._request_repair(run, report)
+        try:
+            repaired_content, _ = yield from self._stream_completion(run, step + 1, tool_choice="none")
+        except Exception as e:
+            print(f"Repair call failed: {e}")
+            repaired_content = None
+        yield self._final_message(content, report, repaired_content)
+
+    def _start_pre_retrieval(self, run: AgentRun):
+        """Starts retrieving the run's goal in the background, unless PRE_RETRIEVAL is off."""
+        if self.pre_retrieval_executor is not None:
+            run.pre_retrieval = PreRetrieval(self.retriever, self.pre_retrieval_executor, run.user_goal, config.PRE_RETRIEVAL_K)
+
+    def _inject_pre_retrieval(self, run: AgentRun):
+        """
+        PRE_RETRIEVAL=inject: adds the run's speculative retrieval to its context as an earlier
+        retrieve_dudraw_functions call. Never waits: returns None if the retrieval is not done
+        yet (the caller tries again before the next LLM call), failed, or was already used.
+        """
+        pre_retrieval = run.pre_retrieval
+        if pre_retrieval is None or config.PRE_RETRIEVAL != "inject" or not pre_retrieval.ready():
+            return None
+        if not pre_retrieval.claim():
+            return None
+        observation = pre_retrieval.result(0)
+        if observation is not None:
+            run._add_to_history("assistant", None, [injected_tool_call(run.user_goal)])
+            run._add_to_history("tool", observation, tool_call_id=INJECTED_TOOL_CALL_ID, name="retrieve_dudraw_functions")
+        return observation
+
+    def _pre_retrieved_observation(self, run: AgentRun, function_name: str, function_args: dict):
+        """
+        The run's speculative retrieval if this is the model's first retrieval and it asks for
+        the same functions, otherwise None. Either way the speculative retrieval is used up.
+        """
+        if run is None or run.pre_retrieval is None or function_name != "retrieve_dudraw_functions":
+            return None
+        if not run.pre_retrieval.claim():
+            return None
+        observation = None
+        if run.pre_retrieval.matches(function_args.get("query", "")):
+            observation = run.pre_retrieval.result()
+        tracing.record_cache_lookup("pre_retrieval", observation is not None)
+        return observation
+
+    def _execute_tool(self, function_name: str, function_args: dict, step: int = 0, run: AgentRun = None):
+        """
+        Runs one tool requested by the LLM.
+        Returns (observation, succeeded); failures are reported to the LLM as the observation text.
+        """
+        with tracing.span("tool", step=step, tool=function_name) as tool_span:
+            observation = self._pre_retrieved_observation(run, function_name, function_args)
+            if observation is not None:
+                tool_span.set("pre_retrieved", True)
+                succeeded = True
+            else:
+                observation, succeeded = self._call_tool(function_name, function_args)
+            tool_span.set("succeeded", succeeded)
+        return observation, succeeded
+
+    def _call_tool(self, function_name: str, function_args: dict):
+        if function_name not in self.available_tools:
+            return f"Error: Tool '{function_name}' not found.", False
+
+        tool_to_call = self.available_tools[function_name]
+        try:
+            if function_name == "calculate_expression":
+                return tool_to_call(function_args.get("expression", "")), True
+            elif function_name == "retrieve_dudraw_functions":
+                # This pulls from the actual data file
+                return tool_to_call(function_args.get("query", "")), True
+            else:
+                return tool_to_call(**function_args), True
+        except Exception as e:
+            return f"Error calling tool '{function_name}': {str(e)}", False
+
+    @staticmethod
+    def _parse_tool_arguments(tool_call: dict, step: int = 0):
+        with tracing.span("tool_args", step=step):
+            return json.loads(tool_call["function"]["arguments"] or "{}")
+
+    def cache_stats(self):
+        """Statistics of each cache the agent uses, or None for caches that are turned off."""
+        return {
+            "embedding": self.retriever.embedding_function.stats() if self.retriever.embedding_function else None,
+            **self.answer_cache.stats()
+        }
+
+    def cached_messages(self, user_goal: str):
+        """Returns the cached messages of an earlier run of an equivalent prompt, or None."""
+        return self.answer_cache.lookup(user_goal)
+
+    def run_agent_stream(self, user_goal: str, coalesce: bool = True):
+        """
+        Run the agent, yielding each message as soon as it is generated.
+        Yields the same messages as run_agent, plus "delta" messages carrying the LLM's tokens as they arrive.
+        Successful runs are stored in the response cache.
+
+        While a run of an equivalent goal is in flight, this one waits for it and replays its
+        messages (without deltas) instead of calling the LLM again, unless coalesce is False
+        (requests bypassing the cache).
+        """
+        key = self.answer_cache.key(user_goal)
+        call, leader = self.single_flight.join(key) if coalesce else (None, True)
+        if not leader:
+            yield {"role": "user", "content": user_goal}
+            shared = self.single_flight.wait(call)
+            if shared is not None:
+                yield from (message for message in shared if message.get("role") != "user")
+                return
+
+        messages = []
+        completed = False
+        try:
+            for message in self._run_agent_stream(user_goal):
+                if message.get("type") != "delta":
+                    messages.append(message)
+                # A follower running on its own has already echoed its goal
+                if leader or message.get("role") != "user":
+                    yield message
+            completed = True
+        finally:
+            if leader:
+                self.single_flight.finish(key, call, messages if completed else None)
+        self.answer_cache.store(user_goal, messages)
+
+    def _run_agent_stream(self, user_goal: str):
+        run = AgentRun(user_goal, self.system_prompt)
+        self._start_pre_retrieval(run)
+
+        yield {"role": "user", "content": user_goal}
+
+        current_thought_displayed = False
+        final_output_generated = False
+        steps = 0
+
+        while not final_output_generated and steps < config.MAX_AGENT_STEPS:
+            steps += 1
+
+            injected = self._inject_pre_retrieval(run)
+            if injected is not None:
+                yield self._tool_call_message("retrieve_dudraw_functions", {"query": user_goal})
+                yield self._retrieval_message(injected)
+
+            try:
+                content, response_tool_calls = yield from self._stream_completion(run, steps)
+                run._add_to_history("assistant", content, response_tool_calls)
+
+                if content and content.strip().startswith("Thought:"):
+                    yield {
+                        "role": "assistant",
+                        "type": "thought",
+                        "content": content.replace('Thought:', '').strip()
+                    }
+                    current_thought_displayed = True
+                elif content and not response_tool_calls:
+                    yield from self._checked_final(run, content, steps)
+                    final_output_generated = True
+                    break
+
+                if response_tool_calls:
+                    tool_messages = []
+                    for tool_call in response_tool_calls:
+                        function_name = tool_call["function"]["name"]
+                        function_args = self._parse_tool_arguments(tool_call, steps)
+
+                        yield self._tool_call_message(function_name, function_args)
+
+                        tool_response, succeeded = self._execute_tool(function_name, function_args, steps, run)
+                        tool_messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": tool_response,
+                            "name": function_name
+                        })
+
+                        # Show the retrieved information
+                        if succeeded and function_name == "retrieve_dudraw_functions":
+                            yield self._retrieval_message(tool_response)
+
+                    if tool_messages:
+                        run.conversation_history.extend(tool_messages)
+
+                elif not current_thought_displayed:
+                    yield {
+                        "role": "assistant",
+                        "type": "thought",
+                        "content": content if content else "Processing..."
+                    }
+
+            except Exception as e:
+                yield {
+                    "role": "assistant",
+                    "type": "error",
+                    "content": f"An error occurred: {str(e)}"
+                }
+                final_output_generated = True
+
+        if not final_output_generated:
+            yield {
+                "role": "assistant",
+                "type": "error",
+                "content": f"Agent failed to generate a final output after {config.MAX_AGENT_STEPS} steps."
+            }
+
+    def run_agent(self, user_goal: str, use_cache: bool = True, coalesce: bool = True):
+        """Run the agent and return all of its messages once the run is complete."""
+        if use_cache:
+            cached = self.cached_messages(user_goal)
+            if cached is not None:
+                return cached
+        return [message for message in self.run_agent_stream(user_goal, coalesce) if message.get("type") != "delta"]
@@ -0,0 +1,85 @@
+"""
+Cache of complete agent answers, usable without creating the agent.
+
+Exact lookups only need the response cache, the system prompt hash and the catalog hash,
+so serverless handlers can answer repeated prompts before importing openai or chromadb.
+The semantic cache needs an embedding function and is attached once the agent exists.
+Storing in it embeds the goal, so that happens on a background thread after the response.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config, tracing
+from .catalog_artifact import catalog_hash
+from .response_cache import create_response_cache, response_cache_key
+
+
+class AnswerCache:
+    """
+    Exact (normalized prompt) and, when enabled, semantic caches of agent runs.
+    Cached answers are only valid for the same model, system prompt and function catalog.
+    """
+    def __init__(self, system_prompt: str, response_cache=None):
+        self.system_prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        self.catalog_hash = catalog_hash(config.EMBEDDING_MODEL_NAME)
+        self.response_cache = response_cache if response_cache is not None else create_response_cache(
+            config.RESPONSE_CACHE_BACKEND,
+            ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS,
+            max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+            path=config.RESPONSE_CACHE_PATH,
+            redis_url=config.RESPONSE_CACHE_REDIS_URL
+        )
+        self.semantic_cache = None
+        # Runs the semantic cache's stores (an embedding call each) off the request path
+        self._store_executor = None
+
+    def enable_semantic_cache(self, embedding_function):
+        """Attaches the semantic cache (if configured), which embeds goals with the given function."""
+        if not config.SEMANTIC_CACHE_ENABLED or embedding_function is None or self.semantic_cache is not None:
+            return
+        # Imported lazily: the semantic cache is the only part of the agent that needs numpy
+        from .semantic_cache import SemanticAnswerCache
+        self.semantic_cache = SemanticAnswerCache(
+            embedding_function,
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+            ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+            max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES
+        )
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+    def scope(self):
+        return f"{config.LLM_MODEL_NAME}:{self.system_prompt_hash}:{self.catalog_hash}"
+
+    def key(self, user_goal: str):
+        return response_cache_key(user_goal, config.LLM_MODEL_NAME, self.system_prompt_hash, self.catalog_hash)
+
+    def lookup(self, user_goal: str):
+        """
+        Returns the cached messages of an earlier run of an equivalent prompt, or None.
+        Exact (normalized) prompt matches are tried first, then paraphrases via the semantic cache.
+        """
+        cached = None
+        if self.response_cache is not None:
+            cached = self.response_cache.get(self.key(user_goal))
+            tracing.record_cache_lookup("response", cached is not None)
+        if cached is None and self.semantic_cache is not None:
+            with tracing.span("semantic_cache_lookup"):
+                cached = self.semantic_cache.lookup(user_goal, self.scope())
+            tracing.record_cache_lookup("semantic", cached is not None)
+        if cached is None:
+            return None
+        # Echo this request's own wording of the prompt
+        return [{"role": "user", "content": user_goal}] + [message for message in cached if message.get("role") != "user"]
+
+    def store(self, user_goal: str, messages):
+        """Stores a run; the exact entry right away, the semantic one in the background."""
+        if self.response_cache is not None:
+            self.response_cache.set(self.key(user_goal), messages)
+        if self.semantic_cache is not None and messages and messages[-1].get("type") == "final":
+            self._store_executor.submit(self.semantic_cache.store, user_goal, self.scope(), messages)
+
+    def stats(self):
+        return {
+            "response": self.response_cache.stats() if self.response_cache else None,
+            "semantic": self.semantic_cache.stats() if self.semantic_cache else None
+        }
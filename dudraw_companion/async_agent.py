@@ -0,0 +1,194 @@
+"""
+An asyncio variant of the agent, used by the ASGI adapter (asgi.py).
+"""
+import asyncio
+
+from . import config, tracing
+from .agent import AgentRun, DuDrawAgent
+from .upstream import AsyncRateLimitedChat
+
+# --- Async Agent Class ---
+class AsyncDuDrawAgent(DuDrawAgent):
+    """
+    An asyncio variant of DuDrawAgent built on the AsyncOpenAI client.
+    All tool calls from one assistant turn run concurrently, so a single process can
+    hold many in-flight agent runs while they wait on the network.
+    """
+    def __init__(self, openai_api_key):
+        super().__init__(openai_api_key)
+        import openai
+        self.async_client = openai.AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+        self.async_chat = AsyncRateLimitedChat(self.async_client)
+
+    async def _execute_tool_async(self, function_name: str, function_args: dict, step: int = 0, run: AgentRun = None):
+        """Runs a (blocking) tool in a worker thread so the event loop stays free."""
+        return await asyncio.to_thread(self._execute_tool, function_name, function_args, step, run)
+
+    async def _stream_completion_async(self, run: AgentRun, step: int, completion: dict, tool_choice: str = "auto"):
+        """
+        Async variant of DuDrawAgent._stream_completion. Async generators cannot return a value,
+        so the assembled "content" and "tool_calls" are stored in completion.
+        """
+        with tracing.span("llm", step=step, model=config.LLM_MODEL_NAME) as llm_span:
+            kwargs = self._completion_kwargs(run, llm_span, tool_choice)
+            stream = await self.async_chat.create(kwargs, self._upstream_tokens(kwargs, llm_span), llm_span)
+
+            content_parts = []
+            tool_calls = {}
+            async for chunk in stream:
+                self._record_chunk(llm_span, chunk)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield {"role": "assistant", "type": "delta", "content": delta.content}
+                self._merge_tool_call_deltas(tool_calls, delta.tool_calls)
+
+        completion["content"] = "".join(content_parts)
+        completion["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+
+    async def _checked_final_async(self, run: AgentRun, content: str, step: int = 0):
+        """Async variant of DuDrawAgent._checked_final."""
+        if config.CODE_VALIDATION == "off":
+            yield self._final_message(content)
+            return
+        # The preview sandbox (SANDBOX_VERIFY) blocks, so validation runs in a worker thread
+        report = await asyncio.to_thread(self._validate_answer, content)
+        if not report["errors"] or config.CODE_VALIDATION != "repair":
+            yield self._final_message(content, report)
+            return
+        yield self._request_repair(run, report)
+        completion = {}
+        try:
+            async for message in self._stream_completion_async(run, step + 1, completion, tool_choice="none"):
+                yield message
+        except Exception as e:
+            print(f"Repair call failed: {e}")
+        yield await asyncio.to_thread(self._final_message, content, report, completion.get("content"))
+
+    async def run_agent_stream_async(self, user_goal: str, coalesce: bool = True):
+        """
+        Run the agent, yielding each message as soon as it is generated.
+        Yields the same messages as DuDrawAgent.run_agent_stream, and caches and coalesces runs the same way.
+        """
+        key = self.answer_cache.key(user_goal)
+        call, leader = self.single_flight.join(key) if coalesce else (None, True)
+        if not leader:
+            yield {"role": "user", "content": user_goal}
+            shared = await self.single_flight.wait_async(call)
+            if shared is not None:
+                for message in shared:
+                    if message.get("role") != "user":
+                        yield message
+                return
+
+        messages = []
+        completed = False
+        try:
+            async for message in self._run_agent_stream_async(user_goal):
+                if message.get("type") != "delta":
+                    messages.append(message)
+                if leader or message.get("role") != "user":
+                    yield message
+            completed = True
+        finally:
+            if leader:
+                self.single_flight.finish(key, call, messages if completed else None)
+        await asyncio.to_thread(self.answer_cache.store, user_goal, messages)
+
+    async def _run_agent_stream_async(self, user_goal: str):
+        run = AgentRun(user_goal, self.system_prompt)
+        self._start_pre_retrieval(run)
+
+        yield {"role": "user", "content": user_goal}
+
+        current_thought_displayed = False
+        final_output_generated = False
+        steps = 0
+
+        while not final_output_generated and steps < config.MAX_AGENT_STEPS:
+            steps += 1
+
+            injected = self._inject_pre_retrieval(run)
+            if injected is not None:
+                yield self._tool_call_message("retrieve_dudraw_functions", {"query": user_goal})
+                yield self._retrieval_message(injected)
+
+            try:
+                completion = {}
+                async for message in self._stream_completion_async(run, steps, completion):
+                    yield message
+                content, response_tool_calls = completion["content"], completion["tool_calls"]
+                run._add_to_history("assistant", content, response_tool_calls)
+
+                if content and content.strip().startswith("Thought:"):
+                    yield {
+                        "role": "assistant",
+                        "type": "thought",
+                        "content": content.replace('Thought:', '').strip()
+                    }
+                    current_thought_displayed = True
+                elif content and not response_tool_calls:
+                    async for message in self._checked_final_async(run, content, steps):
+                        yield message
+                    final_output_generated = True
+                    break
+
+                if response_tool_calls:
+                    calls = []
+                    for tool_call in response_tool_calls:
+                        function_name = tool_call["function"]["name"]
+                        function_args = self._parse_tool_arguments(tool_call, steps)
+                        calls.append((tool_call, function_name, function_args))
+                        yield self._tool_call_message(function_name, function_args)
+
+                    # Run every tool call of this turn at the same time
+                    results = await asyncio.gather(*(
+                        self._execute_tool_async(function_name, function_args, steps, run)
+                        for _, function_name, function_args in calls
+                    ))
+
+                    tool_messages = []
+                    for (tool_call, function_name, _), (tool_response, succeeded) in zip(calls, results):
+                        tool_messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": tool_response,
+                            "name": function_name
+                        })
+                        if succeeded and function_name == "retrieve_dudraw_functions":
+                            yield self._retrieval_message(tool_response)
+
+                    if tool_messages:
+                        run.conversation_history.extend(tool_messages)
+
+                elif not current_thought_displayed:
+                    yield {
+                        "role": "assistant",
+                        "type": "thought",
+                        "content": content if content else "Processing..."
+                    }
+
+            except Exception as e:
+                yield {
+                    "role": "assistant",
+                    "type": "error",
+                    "content": f"An error occurred: {str(e)}"
+                }
+                final_output_generated = True
+
+        if not final_output_generated:
+            yield {
+                "role": "assistant",
+                "type": "error",
+                "content": f"Agent failed to generate a final output after {config.MAX_AGENT_STEPS} steps."
+            }
+
+    async def run_agent_async(self, user_goal: str, use_cache: bool = True, coalesce: bool = True):
+        """Run the agent and return all of its messages once the run is complete."""
+        if use_cache:
+            cached = await asyncio.to_thread(self.cached_messages, user_goal)
+            if cached is not None:
+                return cached
+        return [message async for message in self.run_agent_stream_async(user_goal, coalesce) if message.get("type") != "delta"]
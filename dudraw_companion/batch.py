@@ -0,0 +1,215 @@
+"""
+Batch generation: many goals in one request, e.g. reference solutions for an assignment set.
+
+Goals are deduplicated by their normalized text (as in the response cache key), answered from
+the answer cache when possible, and otherwise run through a bounded pool of agent runs. New
+runs are started no faster than the batch's rate limit and the process-wide BATCH_RATE_PER_MINUTE,
+so batches cannot exhaust the upstream API's rate limit; their LLM calls also queue behind those of
+interactive chats in the shared upstream limiter (upstream.py). Results are produced in completion order:
+
+    {"type": "item", "index": 3, "goal": "...", "status": "ok", "cache": "miss", "final": "...", "messages": [...], "ms": 8123.4}
+    {"type": "item", "index": 7, "goal": "...", "status": "ok", "cache": "duplicate", "duplicate_of": 3, ...}
+    {"type": "summary", "items": 40, "unique": 31, "cache_hits": 5, "runs": 26, "errors": 0, "total_ms": 95012.7}
+
+The Flask and ASGI adapters stream these as NDJSON (one JSON object per line).
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config, tracing
+from .response_cache import normalize_prompt
+from .upstream import PRIORITY_BATCH, request_priority
+
+
+class BatchRequestError(ValueError):
+    """A batch request the server will not run; the message is safe to return to the client."""
+
+
+class RateLimiter:
+    """Token bucket: at most rate_per_minute starts per minute, with bursts of up to burst."""
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns how many seconds to wait before using it (0 if available now)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+# Shared by every batch in this process
+BATCH_LIMITER = RateLimiter(config.BATCH_RATE_PER_MINUTE, burst=config.BATCH_MAX_CONCURRENCY)
+
+
+def parse_batch_request(data: dict):
+    """
+    Validates a batch request body: {"goals": [...], "concurrency": n, "rate_per_minute": r}.
+    Returns (goals, concurrency, rate_per_minute); concurrency and rate are capped by the server's limits.
+    """
+    if not isinstance(data, dict):
+        raise BatchRequestError("Request body must be a JSON object")
+    goals = data.get("goals")
+    if not isinstance(goals, list) or not goals:
+        raise BatchRequestError("goals must be a non-empty list of strings")
+    if len(goals) > config.BATCH_MAX_GOALS:
+        raise BatchRequestError(f"At most {config.BATCH_MAX_GOALS} goals per batch")
+    for index, goal in enumerate(goals):
+        if not isinstance(goal, str) or not goal.strip():
+            raise BatchRequestError(f"goals[{index}] must be a non-empty string")
+    try:
+        concurrency = int(data.get("concurrency", config.BATCH_MAX_CONCURRENCY))
+        rate_per_minute = float(data.get("rate_per_minute", config.BATCH_RATE_PER_MINUTE))
+    except (TypeError, ValueError):
+        raise BatchRequestError("concurrency and rate_per_minute must be numbers")
+    if concurrency < 1 or rate_per_minute <= 0:
+        raise BatchRequestError("concurrency and rate_per_minute must be positive")
+    return goals, min(concurrency, config.BATCH_MAX_CONCURRENCY), min(rate_per_minute, config.BATCH_RATE_PER_MINUTE)
+
+
+def _plan(goals):
+    """Splits goals into unique ones (index -> goal) and duplicates (index of the first occurrence -> [indexes])."""
+    first_index = {}
+    unique = {}
+    duplicates = {}
+    for index, goal in enumerate(goals):
+        key = normalize_prompt(goal)
+        if key in first_index:
+            duplicates.setdefault(first_index[key], []).append(index)
+        else:
+            first_index[key] = index
+            unique[index] = goal
+    return unique, duplicates
+
+
+def _item(index: int, goal: str, messages, cache: str, elapsed: float):
+    final = next((message["content"] for message in reversed(messages) if message.get("type") == "final"), None)
+    error = next((message["content"] for message in reversed(messages) if message.get("type") == "error"), None)
+    return {
+        "type": "item",
+        "index": index,
+        "goal": goal,
+        "status": "ok" if final is not None else "error",
+        "cache": cache,
+        "final": final,
+        "error": None if final is not None else error,
+        "messages": messages,
+        "ms": round(elapsed * 1000, 2)
+    }
+
+
+def _error_item(index: int, goal: str, error: Exception, elapsed: float):
+    return {"type": "item", "index": index, "goal": goal, "status": "error", "cache": "miss", "final": None,
+            "error": f"An error occurred: {error}", "messages": [], "ms": round(elapsed * 1000, 2)}
+
+
+def _with_duplicates(item: dict, goals, duplicates):
+    """The item followed by copies for each duplicate of its goal."""
+    yield item
+    for index in duplicates.get(item["index"], []):
+        yield {**item, "index": index, "goal": goals[index], "cache": "duplicate", "duplicate_of": item["index"], "ms": 0.0}
+
+
+class _Summary:
+    def __init__(self, goals, unique):
+        self.start = time.perf_counter()
+        self.counts = {"items": len(goals), "unique": len(unique), "cache_hits": 0, "runs": 0, "errors": 0}
+
+    def add(self, item: dict):
+        if item["cache"] == "hit":
+            self.counts["cache_hits"] += 1
+        elif item["cache"] == "miss":
+            self.counts["runs"] += 1
+        if item["status"] != "ok":
+            self.counts["errors"] += 1
+
+    def result(self):
+        return {"type": "summary", **self.counts, "total_ms": round((time.perf_counter() - self.start) * 1000, 2)}
+
+
+def _rate_limit_wait(limiter: RateLimiter):
+    """Seconds until both the batch's own and the process-wide limiter allow another run."""
+    return max(limiter.reserve(), BATCH_LIMITER.reserve())
+
+
+def run_batch(agent, goals, concurrency: int, rate_per_minute: float, use_cache: bool = True):
+    """Runs a batch with a DuDrawAgent, yielding items (and finally the summary) as they complete."""
+    unique, duplicates = _plan(goals)
+    summary = _Summary(goals, unique)
+    limiter = RateLimiter(rate_per_minute, burst=concurrency)
+
+    def run_one(index, goal):
+        trace = tracing.start_trace()
+        start = time.perf_counter()
+        try:
+            cached = agent.cached_messages(goal) if use_cache else None
+            if cached is not None:
+                item = _item(index, goal, cached, "hit", time.perf_counter() - start)
+            else:
+                time.sleep(_rate_limit_wait(limiter))
+                start = time.perf_counter()
+                with request_priority(PRIORITY_BATCH):
+                    messages = agent.run_agent(goal, use_cache=False, coalesce=use_cache)
+                item = _item(index, goal, messages, "miss", time.perf_counter() - start)
+        except Exception as e:
+            item = _error_item(index, goal, e, time.perf_counter() - start)
+        tracing.finish_trace(trace, "batch", item["cache"] if item["status"] == "ok" else "error")
+        return item
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(run_one, index, goal) for index, goal in unique.items()]
+        for future in as_completed(futures):
+            for item in _with_duplicates(future.result(), goals, duplicates):
+                summary.add(item)
+                yield item
+    finally:
+        # A client that disconnects stops the runs that have not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
+    yield summary.result()
+
+
+async def run_batch_async(agent, goals, concurrency: int, rate_per_minute: float, use_cache: bool = True):
+    """Runs a batch with an AsyncDuDrawAgent, yielding items (and finally the summary) as they complete."""
+    unique, duplicates = _plan(goals)
+    summary = _Summary(goals, unique)
+    limiter = RateLimiter(rate_per_minute, burst=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_one(index, goal):
+        async with slots:
+            trace = tracing.start_trace()
+            start = time.perf_counter()
+            try:
+                cached = await asyncio.to_thread(agent.cached_messages, goal) if use_cache else None
+                if cached is not None:
+                    item = _item(index, goal, cached, "hit", time.perf_counter() - start)
+                else:
+                    await asyncio.sleep(_rate_limit_wait(limiter))
+                    start = time.perf_counter()
+                    with request_priority(PRIORITY_BATCH):
+                        messages = await agent.run_agent_async(goal, use_cache=False, coalesce=use_cache)
+                    item = _item(index, goal, messages, "miss", time.perf_counter() - start)
+            except Exception as e:
+                item = _error_item(index, goal, e, time.perf_counter() - start)
+            tracing.finish_trace(trace, "batch", item["cache"] if item["status"] == "ok" else "error")
+            return item
+
+    tasks = [asyncio.create_task(run_one(index, goal)) for index, goal in unique.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for item in _with_duplicates(await next_done, goals, duplicates):
+                summary.add(item)
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield summary.result()
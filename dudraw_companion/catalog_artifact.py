@@ -0,0 +1,127 @@
+"""
+Precomputed embeddings for the DuDraw function catalog.
+
+The catalog vectors are written to `catalog_embeddings/catalog-<hash>.npy` with the
+matching documents and metadata in `catalog-<hash>.json`, where <hash> is a content
+hash of DU_DRAW_FUNCTIONS and the embedding model. Retrievers load the artifact with
+zero API calls; it only needs rebuilding when the catalog or model changes:
+
+    python -m dudraw_companion.catalog_artifact
+"""
+import hashlib
+import json
+import os
+import sys
+
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+
+# The artifact lives at the repository root, next to du_draw_functions_data.py
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_DIR = os.environ.get("CATALOG_EMBEDDINGS_DIR", os.path.join(REPO_DIR, "catalog_embeddings"))
+
+
+def build_catalog_documents(functions=DU_DRAW_FUNCTIONS):
+    """Returns the (documents, metadatas, ids) that are embedded and stored for each catalog entry."""
+    documents = []
+    metadatas = []
+    ids = []
+
+    for func in functions:
+        doc_content = f"{func['description']}. Keywords: {', '.join(func.get('keywords', []))}"
+        documents.append(doc_content)
+
+        metadata_for_chroma = func.copy()
+        if 'keywords' in metadata_for_chroma and isinstance(metadata_for_chroma['keywords'], list):
+            metadata_for_chroma['keywords'] = ', '.join(metadata_for_chroma['keywords'])
+        if 'params' in metadata_for_chroma and isinstance(metadata_for_chroma['params'], list):
+            metadata_for_chroma['params'] = ', '.join(metadata_for_chroma['params'])
+
+        metadatas.append(metadata_for_chroma)
+        ids.append(func["id"])
+
+    return documents, metadatas, ids
+
+
+def catalog_hash(model_name: str, functions=DU_DRAW_FUNCTIONS) -> str:
+    """Content hash of the catalog and the embedding model used for it."""
+    payload = json.dumps({"model": model_name, "functions": functions}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _artifact_paths(content_hash: str, directory: str):
+    base = os.path.join(directory, f"catalog-{content_hash}")
+    return base + ".npy", base + ".json"
+
+
+def load_catalog_embeddings(model_name: str, directory: str = ARTIFACT_DIR):
+    """
+    Loads the precomputed catalog embeddings for the current catalog.
+    Returns None if no artifact matches the current catalog hash.
+    """
+    content_hash = catalog_hash(model_name)
+    vectors_path, metadata_path = _artifact_paths(content_hash, directory)
+    if not (os.path.exists(vectors_path) and os.path.exists(metadata_path)):
+        return None
+
+    import numpy as np
+    with open(metadata_path, encoding="utf-8") as f:
+        artifact = json.load(f)
+    artifact["embeddings"] = np.load(vectors_path)
+    return artifact
+
+
+def write_catalog_embeddings(embeddings, model_name: str, directory: str = ARTIFACT_DIR):
+    """Writes the catalog embeddings artifact and removes artifacts of older catalog versions."""
+    import numpy as np
+    content_hash = catalog_hash(model_name)
+    documents, metadatas, ids = build_catalog_documents()
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.shape[0] != len(ids):
+        raise ValueError(f"Expected {len(ids)} catalog embeddings, got {embeddings.shape[0]}")
+
+    os.makedirs(directory, exist_ok=True)
+    vectors_path, metadata_path = _artifact_paths(content_hash, directory)
+    np.save(vectors_path, embeddings)
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "catalog_hash": content_hash,
+            "model": model_name,
+            "dimensions": int(embeddings.shape[1]),
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas
+        }, f, indent=1, ensure_ascii=False)
+
+    for name in os.listdir(directory):
+        if name.startswith("catalog-") and not name.startswith(f"catalog-{content_hash}."):
+            os.remove(os.path.join(directory, name))
+    return vectors_path, metadata_path
+
+
+def main(argv):
+    from . import config
+    # The runtime's model, so the artifact is written under the hash the retriever looks for
+    model_name = config.EMBEDDING_MODEL_NAME
+    force = "--force" in argv
+
+    if not force and load_catalog_embeddings(model_name) is not None:
+        print(f"Catalog embeddings are up to date (catalog-{catalog_hash(model_name)})")
+        return 0
+
+    api_key = config.OPENAI_API_KEY
+    if not api_key:
+        print("OPENAI_API_KEY is required to build the catalog embeddings "
+              "(or commit an up-to-date catalog_embeddings/ artifact).", file=sys.stderr)
+        return 1
+
+    from .embedding_cache import OpenAIEmbedder
+    embedding_function = OpenAIEmbedder(model_name, api_key=api_key)
+    documents, _, _ = build_catalog_documents()
+    print(f"Embedding {len(documents)} DuDraw functions with {model_name}...")
+    vectors_path, _ = write_catalog_embeddings(embedding_function(documents), model_name)
+    print(f"Wrote {vectors_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,251 @@
+"""
+Static check of generated code against the DuDraw function catalog.
+
+The fenced Python of a final answer is parsed with `ast`. Every dudraw function call,
+constant and method call on a `dudraw.dudraw()` object is looked up in an index built
+from the catalog's `syntax` fields. Problems are reported as diagnostics, e.g.
+
+    {"code": "wrong-arg-count", "line": 7, "column": 0, "block": 0, "name": "dudraw.clear",
+     "message": "dudraw.clear takes 1 argument (color_constant) but 0 were given",
+     "syntax": "dudraw.clear(color_constant)"}
+
+Lines are counted from the start of the code block; "block" is the index of the block in the answer.
+"""
+import ast
+import difflib
+import re
+
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+
+MODULE = "dudraw"
+# Similarity an unknown name needs to a catalog name before it is suggested (and its syntax sent to the repair call)
+SUGGESTION_CUTOFF = 0.8
+CODE_BLOCK_PATTERN = re.compile(r"```[ \t]*(?:python3?|py)?[ \t]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+def _dotted_name(node):
+    """"dudraw.clear" for the expression dudraw.clear, or None for anything but names and attributes."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        owner = _dotted_name(node.value)
+        return f"{owner}.{node.attr}" if owner else None
+    return None
+
+
+class CatalogSignatures:
+    """The catalog's functions, object methods and constants, parsed from their syntax fields."""
+    def __init__(self, functions=DU_DRAW_FUNCTIONS):
+        # "dudraw.clear" -> {"name", "syntax", "params"}
+        self.functions = {}
+        # Methods of dudraw.dudraw() objects: "plot" -> {"name", "syntax", "params"}
+        self.methods = {}
+        # "dudraw.RED" -> syntax
+        self.constants = {}
+        for func in functions:
+            self._add(func)
+
+    def _add(self, func):
+        statement = ast.parse(func["syntax"]).body[0]
+        expression = statement.value
+        if not isinstance(expression, ast.Call):
+            self.constants[_dotted_name(expression)] = func["syntax"]
+            return
+        name = _dotted_name(expression.func)
+        signature = {
+            "name": func["id"],
+            "syntax": func["syntax"],
+            "params": [ast.unparse(arg) for arg in expression.args]
+        }
+        owner, _, attribute = name.rpartition(".")
+        if owner == MODULE:
+            self.functions[name] = signature
+        else:
+            self.methods[attribute] = signature
+
+    def suggestion(self, name: str):
+        """
+        The catalog function or constant an unknown name most likely meant, or None when nothing is
+        close. Only the attribute part is compared: every full name shares the "dudraw." prefix.
+        """
+        by_attribute = {candidate.rpartition(".")[2]: candidate for candidate in list(self.functions) + list(self.constants)}
+        attribute = name.rpartition(".")[2]
+        # dudraw.circle -> dudraw.filled_circle
+        variants = [candidate for suffix, candidate in by_attribute.items() if suffix.endswith(f"_{attribute}")]
+        if variants:
+            return variants[0]
+        matches = difflib.get_close_matches(attribute, list(by_attribute), n=1, cutoff=SUGGESTION_CUTOFF)
+        return by_attribute[matches[0]] if matches else None
+
+
+# --- AST Checks ---
+class _CodeChecker(ast.NodeVisitor):
+    """Collects the diagnostics of one code block."""
+    def __init__(self, signatures: CatalogSignatures, block: int):
+        self.signatures = signatures
+        self.block = block
+        self.diagnostics = []
+        # Local names bound to the dudraw module, to catalog members, and to dudraw.dudraw() objects
+        self.module_aliases = set()
+        self.imported = {}
+        self.star_import = False
+        self.objects = set()
+
+    def collect_bindings(self, tree):
+        """Finds the imports and dudraw objects first, so the order of definitions does not matter."""
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.name == MODULE:
+                        self.module_aliases.add(alias.asname or MODULE)
+            elif isinstance(node, ast.ImportFrom) and node.module == MODULE:
+                for alias in node.names:
+                    if alias.name == "*":
+                        self.star_import = True
+                        continue
+                    full_name = f"{MODULE}.{alias.name}"
+                    self.imported[alias.asname or alias.name] = full_name
+                    if not self._is_catalog_member(full_name):
+                        self._report(node, "unknown-name", full_name, f"{full_name} is not in the DuDraw catalog")
+            elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Call):
+                if self._resolve(node.value.func) == f"{MODULE}.{MODULE}":
+                    self.objects.update(target.id for target in node.targets if isinstance(target, ast.Name))
+
+    def _is_catalog_member(self, full_name: str):
+        return full_name in self.signatures.functions or full_name in self.signatures.constants
+
+    def _resolve(self, node):
+        """The catalog name ("dudraw.x") an expression refers to, or None if it is not a dudraw member."""
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in self.module_aliases:
+            return f"{MODULE}.{node.attr}"
+        if isinstance(node, ast.Name):
+            if node.id in self.imported:
+                return self.imported[node.id]
+            if self.star_import and self._is_catalog_member(f"{MODULE}.{node.id}"):
+                return f"{MODULE}.{node.id}"
+        return None
+
+    def _report(self, node, code: str, name: str, message: str, syntax: str = None):
+        diagnostic = {
+            "code": code,
+            "line": getattr(node, "lineno", 0),
+            "column": getattr(node, "col_offset", 0),
+            "block": self.block,
+            "name": name,
+            "message": message
+        }
+        if syntax is None and code in ("unknown-function", "unknown-name"):
+            suggestion = self.signatures.suggestion(name)
+            if suggestion:
+                diagnostic["message"] += f"; did you mean {suggestion}?"
+                diagnostic["suggestion"] = suggestion
+        if syntax:
+            diagnostic["syntax"] = syntax
+        self.diagnostics.append(diagnostic)
+
+    def _check_arguments(self, node: ast.Call, name: str, signature: dict):
+        # *args and **kwargs make the count unknowable statically
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords):
+            return
+        given = len(node.args) + len(node.keywords)
+        expected = len(signature["params"])
+        if given != expected:
+            params = f" ({', '.join(signature['params'])})" if signature["params"] else ""
+            self._report(node, "wrong-arg-count", name,
+                         f"{name} takes {expected} argument{'s' if expected != 1 else ''}{params} but {given} {'was' if given == 1 else 'were'} given",
+                         signature["syntax"])
+
+    def visit_Call(self, node: ast.Call):
+        name = self._resolve(node.func)
+        if name is not None:
+            signature = self.signatures.functions.get(name)
+            if signature is not None:
+                self._check_arguments(node, name, signature)
+            elif name in self.signatures.constants:
+                self._report(node, "not-callable", name, f"{name} is a constant, not a function", self.signatures.constants[name])
+            else:
+                self._report(node, "unknown-function", name, f"{name} is not in the DuDraw catalog")
+        elif isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) and node.func.value.id in self.objects:
+            name = f"{node.func.value.id}.{node.func.attr}"
+            signature = self.signatures.methods.get(node.func.attr)
+            if signature is not None:
+                self._check_arguments(node, name, signature)
+            else:
+                self._report(node, "unknown-method", name, f"{name} is not a method of dudraw objects in the DuDraw catalog")
+        else:
+            self.visit(node.func)
+        # The callee itself was checked above; only its arguments remain
+        for arg in node.args:
+            self.visit(arg)
+        for keyword in node.keywords:
+            self.visit(keyword.value)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        name = self._resolve(node)
+        if name is not None and isinstance(node.ctx, ast.Load) and not self._is_catalog_member(name):
+            self._report(node, "unknown-name", name, f"{name} is not in the DuDraw catalog")
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id == MODULE and isinstance(node.ctx, ast.Load) and MODULE not in self.module_aliases and not any(
+                diagnostic["code"] == "missing-import" for diagnostic in self.diagnostics):
+            self._report(node, "missing-import", MODULE, "dudraw is used but never imported (add `import dudraw`)")
+
+
+def extract_code_blocks(content: str):
+    """The fenced Python code blocks of an answer, in order."""
+    return [match.group(1) for match in CODE_BLOCK_PATTERN.finditer(content or "")]
+
+
+def validate_code(code: str, signatures: CatalogSignatures, block: int = 0):
+    """Diagnostics of one block of code, sorted by position."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [{
+            "code": "syntax-error",
+            "line": e.lineno or 0,
+            "column": max((e.offset or 1) - 1, 0),
+            "block": block,
+            "name": None,
+            "message": f"Invalid Python: {e.msg}"
+        }]
+    checker = _CodeChecker(signatures, block)
+    checker.collect_bindings(tree)
+    checker.visit(tree)
+    return sorted(checker.diagnostics, key=lambda diagnostic: (diagnostic["line"], diagnostic["column"]))
+
+
+def validate_answer(content: str, signatures: CatalogSignatures):
+    """
+    Checks every fenced Python block of an answer.
+    Returns {"blocks": number of code blocks, "errors": number of diagnostics, "diagnostics": [...]}.
+    """
+    blocks = extract_code_blocks(content)
+    diagnostics = []
+    for index, code in enumerate(blocks):
+        diagnostics.extend(validate_code(code, signatures, index))
+    return {"blocks": len(blocks), "errors": len(diagnostics), "diagnostics": diagnostics}
+
+
+def repair_request(diagnostics, signatures: CatalogSignatures):
+    """The user message asking the LLM to fix exactly the given diagnostics."""
+    lines = ["The code in your answer does not match the DuDraw function catalog:"]
+    syntaxes = []
+    several_blocks = any(diagnostic["block"] for diagnostic in diagnostics)
+    for diagnostic in diagnostics:
+        location = f"code block {diagnostic['block'] + 1}, line {diagnostic['line']}" if several_blocks else f"line {diagnostic['line']}"
+        lines.append(f"- {location}: {diagnostic['message']}")
+        related = [diagnostic.get("syntax")]
+        suggestion = diagnostic.get("suggestion")
+        if suggestion:
+            related.append(signatures.functions[suggestion]["syntax"] if suggestion in signatures.functions else signatures.constants[suggestion])
+        syntaxes.extend(syntax for syntax in related if syntax and syntax not in syntaxes)
+    if syntaxes:
+        lines.append("")
+        lines.append("Exact catalog syntax:")
+        lines.extend(f"- `{syntax}`" for syntax in syntaxes)
+    lines.append("")
+    lines.append("Fix only these problems and reply with the complete corrected answer in the same format, "
+                 "using only DuDraw functions and constants from the catalog.")
+    return "\n".join(lines)
@@ -0,0 +1,84 @@
+"""
+Configuration shared by every adapter (Flask, ASGI, Netlify, Streamlit).
+
+All values are read from the environment once, at import time. Adapters that need
+different defaults (e.g. /tmp paths on Netlify) set them with os.environ.setdefault
+before importing dudraw_companion.
+"""
+import os
+
+# --- Configuration ---
+# Get API key from environment variable for security
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+
+# Specify the LLM model to use
+LLM_MODEL_NAME = "gpt-4o-mini"
+MAX_AGENT_STEPS = 5
+# Append a compact syntax reference of the core functions to the system prompt
+PINNED_CHEAT_SHEET = os.environ.get("PINNED_CHEAT_SHEET", "false").lower() == "true"
+# Input tokens (messages plus tool definitions) allowed per LLM call; old tool results are shrunk to fit
+CONTEXT_MAX_INPUT_TOKENS = int(os.environ.get("CONTEXT_MAX_INPUT_TOKENS", "8000"))
+EMBEDDING_MODEL_NAME = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_TIMEOUT_SECONDS = float(os.environ.get("EMBEDDING_TIMEOUT_SECONDS", "10"))
+# "dense" (embeddings), "lexical" (offline BM25) or "hybrid" (both, reciprocal-rank fusion)
+RETRIEVER_MODE = os.environ.get("RETRIEVER_MODE", "dense")
+# Vector store for dense retrieval: "chroma" (ChromaDB collection) or "numpy" (in-process vector index, no chromadb import)
+RETRIEVER_BACKEND = os.environ.get("RETRIEVER_BACKEND", "chroma")
+# Create the agent when the adapter is imported: "auto" (only when the warm-start snapshot makes it cheap), "true" or "false"
+AGENT_EAGER_INIT = os.environ.get("AGENT_EAGER_INIT", "auto").lower()
+# Directory of the persistent ChromaDB collection
+CHROMA_PATH = os.environ.get("CHROMA_PATH", "./chroma_db")
+# Check the code of final answers against the function catalog: "annotate" (diagnostics only), "repair"
+# (also one extra LLM call to fix the errors found) or "off"
+CODE_VALIDATION = os.environ.get("CODE_VALIDATION", "annotate").lower()
+# Run final answers in the headless preview sandbox: a runtime error counts like a catalog error, and
+# the final message carries a PNG preview of the last frame
+SANDBOX_VERIFY = os.environ.get("SANDBOX_VERIFY", "false").lower() == "true"
+# Preview sandbox (sandbox.py): reusable worker processes and the budget of each program
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", "2"))
+SANDBOX_CPU_SECONDS = float(os.environ.get("SANDBOX_CPU_SECONDS", "2"))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_MAX_FRAMES = int(os.environ.get("SANDBOX_MAX_FRAMES", "60"))
+SANDBOX_TIMEOUT_SECONDS = float(os.environ.get("SANDBOX_TIMEOUT_SECONDS", "5"))
+SANDBOX_MAX_JOBS_PER_WORKER = int(os.environ.get("SANDBOX_MAX_JOBS_PER_WORKER", "100"))
+SANDBOX_MAX_CANVAS_SIZE = int(os.environ.get("SANDBOX_MAX_CANVAS_SIZE", "1024"))
+# Unprivileged account workers switch to when the server runs as root (empty: stay root)
+SANDBOX_USER = os.environ.get("SANDBOX_USER", "nobody")
+# Longest side of preview PNGs
+SANDBOX_PREVIEW_SIZE = int(os.environ.get("SANDBOX_PREVIEW_SIZE", "256"))
+# Retrieve the user's goal in the background during the first LLM call: "off", "speculative"
+# (served if the model asks for the same functions) or "inject" (added to the context once ready)
+PRE_RETRIEVAL = os.environ.get("PRE_RETRIEVAL", "off").lower()
+PRE_RETRIEVAL_K = int(os.environ.get("PRE_RETRIEVAL_K", "6"))
+# "speculative" mode: share of the model query's top BM25 entries that the goal's must also rank
+PRE_RETRIEVAL_MIN_OVERLAP = float(os.environ.get("PRE_RETRIEVAL_MIN_OVERLAP", "0.5"))
+PRE_RETRIEVAL_WORKERS = int(os.environ.get("PRE_RETRIEVAL_WORKERS", "4"))
+
+# Cache of complete agent runs: "memory", "sqlite", "redis" or "off"
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "./response_cache.sqlite3")
+RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Semantic cache: answers paraphrased goals whose embedding is at least SEMANTIC_CACHE_THRESHOLD similar
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+# /api/batch: goals per request, agent runs in flight per batch, and agent runs started per minute (per batch and per process)
+BATCH_MAX_GOALS = int(os.environ.get("BATCH_MAX_GOALS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_RATE_PER_MINUTE = float(os.environ.get("BATCH_RATE_PER_MINUTE", "30"))
+# OpenAI chat calls: starting requests/tokens per minute (then learned from x-ratelimit-* headers; 0 = unlimited),
+# retries of 429/5xx/connection errors with jittered exponential backoff, and the longest a call may wait in the queue
+UPSTREAM_REQUESTS_PER_MINUTE = int(os.environ.get("UPSTREAM_REQUESTS_PER_MINUTE", "500"))
+UPSTREAM_TOKENS_PER_MINUTE = int(os.environ.get("UPSTREAM_TOKENS_PER_MINUTE", "200000"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE_SECONDS = float(os.environ.get("UPSTREAM_BACKOFF_BASE_SECONDS", "0.5"))
+UPSTREAM_BACKOFF_MAX_SECONDS = float(os.environ.get("UPSTREAM_BACKOFF_MAX_SECONDS", "20"))
+UPSTREAM_MAX_QUEUE_SECONDS = float(os.environ.get("UPSTREAM_MAX_QUEUE_SECONDS", "30"))
+# Concurrent runs of an equivalent goal share one agent run; followers wait at most this long for it (0 turns coalescing off)
+SINGLE_FLIGHT_MAX_WAIT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_MAX_WAIT_SECONDS", "60"))
+# Request/response header: send "bypass" to skip the cache; responses report HIT, MISS or COALESCED
+CACHE_HEADER = "X-DuDraw-Cache"
@@ -0,0 +1,156 @@
+"""
+Token accounting and an input-token budget for the agent's conversation.
+
+Every agent step resends the whole conversation, so input tokens drive both cost and
+time to first token. ContextBudget counts the tokens of each message with a local
+tokenizer (tiktoken, a requirement of the server and the Netlify function; ~4 characters
+per token only if its encoding cannot be loaded, which is logged once) and, when a step
+would exceed the budget, shrinks the oldest tool observations first:
+
+  1. retrieval observations are summarized to their "Function ID" and "Syntax" lines,
+  2. remaining old observations are elided to a one-line placeholder,
+  3. whole old assistant turns are dropped together with their tool results.
+
+System messages, the user's goal and the most recent assistant turn with its tool
+results are never changed, and a tool result is never separated from the assistant
+message that requested it.
+"""
+import json
+import math
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+ELIDED_OBSERVATION = "[Earlier tool result removed to save context. Call the tool again if you need it.]"
+
+
+_fallback_logged = False
+
+
+def _load_tokenizer(model_name: str):
+    """The tiktoken encoding for model_name, or None (counts are then estimated) if it cannot be loaded."""
+    global _fallback_logged
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # ImportError, or the encoding could not be downloaded
+        if not _fallback_logged:
+            _fallback_logged = True
+            print(f"tiktoken unavailable ({type(e).__name__}: {e}); estimating tokens as characters / 4")
+        return None
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken; estimates ~4 characters per token if its encoding cannot be loaded."""
+    def __init__(self, model_name: str = "gpt-4o-mini"):
+        self._encoding = _load_tokenizer(model_name)
+        self.name = "tiktoken" if self._encoding is not None else "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / 4)
+
+    def count_message(self, message: dict) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count(message.get("content") or "") + self.count(message.get("name") or "")
+        for tool_call in message.get("tool_calls") or []:
+            if hasattr(tool_call, "model_dump"):
+                tool_call = tool_call.model_dump()
+            function = tool_call.get("function") or {}
+            tokens += self.count(function.get("name") or "") + self.count(function.get("arguments") or "")
+        return tokens
+
+    def count_messages(self, messages) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def count_tools(self, tools) -> int:
+        """Approximate cost of the tool definitions sent with every request."""
+        return self.count(json.dumps(tools)) if tools else 0
+
+
+def summarize_observation(content: str) -> str:
+    """Keeps only the function ids and syntax of a retrieval observation, which is what the final code needs."""
+    kept = [line for line in content.splitlines() if line.startswith(("Function ID:", "Syntax:"))]
+    if not kept:
+        return ELIDED_OBSERVATION
+    return "[Earlier lookup, summarized]\n" + "\n".join(kept)
+
+
+# --- Context Budget ---
+class ContextBudget:
+    """Fits a conversation into max_input_tokens (including the tool definitions) before each LLM call."""
+    def __init__(self, max_input_tokens: int, counter: TokenCounter = None, tools=None):
+        self.max_input_tokens = max_input_tokens
+        self.counter = counter or TokenCounter()
+        self.tools_tokens = self.counter.count_tools(tools)
+
+    def _turns(self, messages):
+        """
+        Groups the messages into pinned messages (system prompt, user goal) and assistant turns,
+        each turn being an assistant message followed by its tool results.
+        """
+        pinned, turns = [], []
+        goal_seen = False
+        for index, message in enumerate(messages):
+            role = message.get("role")
+            if role == "system" or (role == "user" and not goal_seen):
+                goal_seen = goal_seen or role == "user"
+                pinned.append(index)
+            elif role == "tool" and turns:
+                turns[-1].append(index)
+            else:
+                turns.append([index])
+        return pinned, turns
+
+    def fit(self, messages):
+        """
+        Returns (messages, report): a copy of messages that fits the budget where possible, and
+        a report with the token count before and after and what was summarized, elided or dropped.
+        The input list is not modified.
+        """
+        messages = [dict(message) for message in messages]
+        sizes = [self.counter.count_message(message) for message in messages]
+        report = {
+            "budget": self.max_input_tokens,
+            "tokens_before": sum(sizes) + self.tools_tokens,
+            "summarized": 0,
+            "elided": 0,
+            "dropped": 0
+        }
+
+        def total():
+            return sum(size for size in sizes if size is not None) + self.tools_tokens
+
+        if total() > self.max_input_tokens:
+            _, turns = self._turns(messages)
+            # The latest turn is what the model is answering; only older turns are shrunk
+            old_observations = [index for turn in turns[:-1] for index in turn if messages[index].get("role") == "tool"]
+
+            for shrink, counter_key in ((summarize_observation, "summarized"), (lambda content: ELIDED_OBSERVATION, "elided")):
+                for index in old_observations:
+                    if total() <= self.max_input_tokens:
+                        break
+                    content = messages[index].get("content") or ""
+                    shrunk = shrink(content)
+                    if len(shrunk) < len(content):
+                        messages[index]["content"] = shrunk
+                        sizes[index] = self.counter.count_message(messages[index])
+                        report[counter_key] += 1
+
+            for turn in turns[:-1]:
+                if total() <= self.max_input_tokens:
+                    break
+                for index in turn:
+                    sizes[index] = None
+                report["dropped"] += 1
+
+        fitted = [message for message, size in zip(messages, sizes) if size is not None]
+        report["tokens_after"] = total()
+        report["over_budget"] = report["tokens_after"] > self.max_input_tokens
+        return fitted, report
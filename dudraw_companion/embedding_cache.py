@@ -0,0 +1,172 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from . import tracing
+
+
+# --- OpenAI Embedding Function ---
+class OpenAIEmbedder:
+    """
+    Embeds texts with the OpenAI embeddings API.
+    A lightweight stand-in for ChromaDB's OpenAIEmbeddingFunction that does not import chromadb.
+    """
+    def __init__(self, model_name: str, api_key: str = None, timeout: float = None):
+        import openai
+        self.model_name = model_name
+        self.client = openai.OpenAI(api_key=api_key, timeout=timeout)
+
+    def __call__(self, input):
+        texts = list(input)
+        with tracing.span("embedding", model=self.model_name, texts=len(texts)):
+            response = self.client.embeddings.create(model=self.model_name, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+# --- Caching Embedding Function ---
+class CachingEmbeddingFunction:
+    """
+    Wraps an embedding function with a persistent on-disk embedding cache.
+
+    Vectors are stored in SQLite keyed by (model, sha256(text)), with an in-memory LRU
+    in front of it. The on-disk store is bounded to `max_entries` rows, evicting the
+    least recently used vectors first. Only texts missing from both layers are sent to
+    the wrapped embedding function, in a single batch.
+    """
+    def __init__(self, embedding_function, model_name: str, path: str, memory_size: int = 1024, max_entries: int = 50000):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        self._evictions = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __call__(self, input):
+        texts = list(input)
+        hashes = [self._hash(text) for text in texts]
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            now = time.time()
+            for i, text_hash in enumerate(hashes):
+                vector = self._memory_get(text_hash)
+                if vector is not None:
+                    vectors[i] = vector
+                    self._hits["memory"] += 1
+                    continue
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                    (self.model_name, text_hash)
+                ).fetchone()
+                if row is not None:
+                    vector = array("f")
+                    vector.frombytes(row[0])
+                    vectors[i] = vector.tolist()
+                    self._memory_put(text_hash, vectors[i])
+                    self._db.execute(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                        (now, self.model_name, text_hash)
+                    )
+                    self._hits["disk"] += 1
+            self._db.commit()
+
+        # Each distinct missing text is embedded once, even if it repeats in the batch
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(hashes[i], []).append(i)
+        if missing:
+            # Embed all misses in one request, outside the lock so other threads are not blocked
+            embedded = self.embedding_function([texts[positions[0]] for positions in missing.values()])
+            with self._lock:
+                now = time.time()
+                for (text_hash, positions), vector in zip(missing.items(), embedded):
+                    vector = [float(value) for value in vector]
+                    for i in positions:
+                        vectors[i] = vector
+                    self._memory_put(text_hash, vector)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                        (self.model_name, text_hash, array("f", vector).tobytes(), now)
+                    )
+                self._misses += len(missing)
+                self._evict()
+                self._db.commit()
+
+        return vectors
+
+    def _memory_get(self, text_hash: str):
+        vector = self._memory.get(text_hash)
+        if vector is not None:
+            self._memory.move_to_end(text_hash)
+        return vector
+
+    def _memory_put(self, text_hash: str, vector):
+        self._memory[text_hash] = vector
+        self._memory.move_to_end(text_hash)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Drops the least recently used rows once the on-disk store grows past max_entries."""
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self._evictions += excess
+
+    def stats(self):
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            hits = self._hits["memory"] + self._hits["disk"]
+            lookups = hits + self._misses
+            return {
+                "model": self.model_name,
+                "memory_hits": self._hits["memory"],
+                "disk_hits": self._hits["disk"],
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "evictions": self._evictions
+            }
+
+
+def as_chroma_embedding_function(embedding_function):
+    """Adapts any embedding function to ChromaDB's EmbeddingFunction interface (imports chromadb)."""
+    from chromadb.api.types import EmbeddingFunction
+
+    class ChromaEmbeddingFunction(EmbeddingFunction):
+        def __init__(self, wrapped):
+            self.wrapped = wrapped
+
+        def __call__(self, input):
+            return self.wrapped(input)
+
+    return ChromaEmbeddingFunction(embedding_function)
@@ -0,0 +1,320 @@
+"""
+A headless stand-in for the `dudraw` module, used by the preview sandbox (sandbox.py).
+
+It implements the API described in DU_DRAW_FUNCTIONS with a small pure-Python rasterizer:
+drawing goes into an RGB buffer, `show` records a frame instead of opening a window (its
+delay is skipped), and the input functions report an idle mouse and keyboard. Text is not
+rendered. Names outside the catalog raise AttributeError.
+
+The last shown frame is encoded with a minimal PNG writer (zlib and struct only).
+"""
+import math
+import struct
+import zlib
+
+DEFAULT_CANVAS_SIZE = 512
+
+
+class FrameLimitReached(BaseException):
+    """Raised by show() once the frame budget is spent; a BaseException, so `except Exception` in the program does not catch it."""
+
+
+class Color:
+    def __init__(self, r: int = 0, g: int = 0, b: int = 0):
+        self.r, self.g, self.b = int(r), int(g), int(b)
+
+    def rgb(self):
+        return bytes((max(0, min(255, self.r)), max(0, min(255, self.g)), max(0, min(255, self.b))))
+
+    def __repr__(self):
+        return f"Color({self.r}, {self.g}, {self.b})"
+
+
+# --- Catalog Constants ---
+BLACK = Color(0, 0, 0)
+BLUE = Color(0, 0, 255)
+CYAN = Color(0, 255, 255)
+DARK_BLUE = Color(0, 0, 128)
+DARK_GRAY = Color(64, 64, 64)
+GREEN = Color(0, 255, 0)
+GRAY = Color(128, 128, 128)
+LIGHT_GRAY = Color(192, 192, 192)
+MAGENTA = Color(255, 0, 255)
+ORANGE = Color(255, 200, 0)
+PINK = Color(255, 175, 175)
+RED = Color(255, 0, 0)
+WHITE = Color(255, 255, 255)
+YELLOW = Color(255, 255, 0)
+ARROW_LEFT = "ARROW_LEFT"
+ARROW_RIGHT = "ARROW_RIGHT"
+ARROW_UP = "ARROW_UP"
+ARROW_DOWN = "ARROW_DOWN"
+
+
+# --- Canvas ---
+class _Canvas:
+    """RGB pixel buffer plus the drawing state dudraw keeps between calls."""
+    def __init__(self, max_frames: int, max_canvas_size: int):
+        self.max_frames = max_frames
+        self.max_canvas_size = max_canvas_size
+        self.frames = 0
+        self.frame = None
+        self.pen = BLACK.rgb()
+        self.x_scale = (0.0, 1.0)
+        self.y_scale = (0.0, 1.0)
+        self.resize(DEFAULT_CANVAS_SIZE, DEFAULT_CANVAS_SIZE)
+
+    def resize(self, width: int, height: int):
+        # Oversized canvases are scaled down proportionally; coordinates are in user units anyway
+        factor = min(1.0, self.max_canvas_size / max(width, height, 1))
+        self.width = max(1, int(width * factor))
+        self.height = max(1, int(height * factor))
+        self.pixels = bytearray(WHITE.rgb() * (self.width * self.height))
+        self.pen_width = max(1, round(max(self.width, self.height) / 300))
+
+    # Coordinate transforms: user units -> pixel units (y grows downwards in the buffer)
+    def px(self, x: float):
+        low, high = self.x_scale
+        return (x - low) / (high - low) * self.width
+
+    def py(self, y: float):
+        low, high = self.y_scale
+        return (1 - (y - low) / (high - low)) * self.height
+
+    def sx(self, length: float):
+        low, high = self.x_scale
+        return abs(length / (high - low) * self.width)
+
+    def sy(self, length: float):
+        low, high = self.y_scale
+        return abs(length / (high - low) * self.height)
+
+    def span(self, row: int, start: int, end: int):
+        """Fills pixels [start, end] of a row with the pen color, clipped to the canvas."""
+        if row < 0 or row >= self.height:
+            return
+        start, end = max(start, 0), min(end, self.width - 1)
+        if start > end:
+            return
+        offset = (row * self.width + start) * 3
+        self.pixels[offset:offset + (end - start + 1) * 3] = self.pen * (end - start + 1)
+
+    def fill_rect(self, left: float, top: float, right: float, bottom: float):
+        for row in range(max(0, math.floor(top)), min(self.height, math.ceil(bottom))):
+            self.span(row, math.floor(left), math.ceil(right) - 1)
+
+    def fill_ellipse(self, cx: float, cy: float, rx: float, ry: float):
+        if rx <= 0 or ry <= 0:
+            self.dot(cx, cy)
+            return
+        for row in range(max(0, math.floor(cy - ry)), min(self.height, math.ceil(cy + ry) + 1)):
+            dy = (row + 0.5 - cy) / ry
+            if abs(dy) > 1:
+                continue
+            half = rx * math.sqrt(1 - dy * dy)
+            self.span(row, math.ceil(cx - half - 0.5), math.floor(cx + half - 0.5))
+
+    def fill_polygon(self, points):
+        """Scanline fill of a polygon given in pixel coordinates."""
+        top = max(0, math.floor(min(y for _, y in points)))
+        bottom = min(self.height, math.ceil(max(y for _, y in points)) + 1)
+        edges = list(zip(points, points[1:] + points[:1]))
+        for row in range(top, bottom):
+            center = row + 0.5
+            crossings = sorted(
+                x0 + (center - y0) * (x1 - x0) / (y1 - y0)
+                for (x0, y0), (x1, y1) in edges
+                if (y0 <= center < y1) or (y1 <= center < y0)
+            )
+            for start, end in zip(crossings[::2], crossings[1::2]):
+                self.span(row, math.ceil(start - 0.5), math.floor(end - 0.5))
+
+    def dot(self, x: float, y: float):
+        half = self.pen_width / 2
+        self.fill_rect(x - half, y - half, x + half, y + half)
+
+    def line(self, x0: float, y0: float, x1: float, y1: float):
+        steps = max(1, math.ceil(max(abs(x1 - x0), abs(y1 - y0))))
+        for i in range(steps + 1):
+            t = i / steps
+            self.dot(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t)
+
+    def show(self):
+        self.frames += 1
+        self.frame = bytes(self.pixels)
+        if self.frames >= self.max_frames:
+            raise FrameLimitReached(f"Stopped after {self.frames} frames")
+
+
+_canvas = _Canvas(max_frames=60, max_canvas_size=1024)
+
+
+def reset(max_frames: int = 60, max_canvas_size: int = 1024):
+    """Starts a fresh program: blank default canvas, default scales and pen, no frames."""
+    global _canvas
+    _canvas = _Canvas(max_frames, max_canvas_size)
+
+
+def frames_shown():
+    return _canvas.frames
+
+
+def last_frame():
+    """(width, height, RGB bytes) of the last shown frame, or of the canvas if nothing was shown."""
+    return _canvas.width, _canvas.height, _canvas.frame if _canvas.frame is not None else bytes(_canvas.pixels)
+
+
+# --- Catalog Functions ---
+def set_canvas_size(width, height):
+    _canvas.resize(int(width), int(height))
+
+
+def set_x_scale(min_x, max_x):
+    if min_x == max_x:
+        raise ValueError("min_x and max_x must differ")
+    _canvas.x_scale = (float(min_x), float(max_x))
+
+
+def set_y_scale(min_y, max_y):
+    if min_y == max_y:
+        raise ValueError("min_y and max_y must differ")
+    _canvas.y_scale = (float(min_y), float(max_y))
+
+
+def set_pen_color(color_constant):
+    if not isinstance(color_constant, Color):
+        raise TypeError(f"set_pen_color expects a dudraw color constant, got {type(color_constant).__name__}")
+    _canvas.pen = color_constant.rgb()
+
+
+def set_pen_color_rgb(r, g, b):
+    _canvas.pen = Color(r, g, b).rgb()
+
+
+def clear(color_constant):
+    if not isinstance(color_constant, Color):
+        raise TypeError(f"clear expects a dudraw color constant, got {type(color_constant).__name__}")
+    _canvas.pixels[:] = color_constant.rgb() * (_canvas.width * _canvas.height)
+
+
+def show(delay_ms):
+    _canvas.show()
+
+
+def filled_square(x, y, half_length):
+    filled_rectangle(x, y, half_length, half_length)
+
+
+def filled_rectangle(x, y, half_width, half_height):
+    cx, cy = _canvas.px(x), _canvas.py(y)
+    hw, hh = _canvas.sx(half_width), _canvas.sy(half_height)
+    _canvas.fill_rect(cx - hw, cy - hh, cx + hw, cy + hh)
+
+
+def filled_circle(x, y, radius):
+    _canvas.fill_ellipse(_canvas.px(x), _canvas.py(y), _canvas.sx(radius), _canvas.sy(radius))
+
+
+def filled_triangle(x1, y1, x2, y2, x3, y3):
+    _canvas.fill_polygon([(_canvas.px(x), _canvas.py(y)) for x, y in ((x1, y1), (x2, y2), (x3, y3))])
+
+
+def line(x1, y1, x2, y2):
+    _canvas.line(_canvas.px(x1), _canvas.py(y1), _canvas.px(x2), _canvas.py(y2))
+
+
+def set_font_size(size):
+    pass
+
+
+def text(x, y, text_string):
+    pass
+
+
+# The sandbox has no mouse or keyboard: the cursor rests at the center and no keys are typed
+def mouse_is_pressed():
+    return False
+
+
+def mouse_x():
+    return (_canvas.x_scale[0] + _canvas.x_scale[1]) / 2
+
+
+def mouse_y():
+    return (_canvas.y_scale[0] + _canvas.y_scale[1]) / 2
+
+
+def mouse_position():
+    return mouse_x(), mouse_y()
+
+
+def mouse_clicked():
+    return False
+
+
+def has_next_key_typed():
+    return False
+
+
+def next_key_typed():
+    return ""
+
+
+def next_key():
+    return ""
+
+
+def poll():
+    return None
+
+
+def key():
+    return ""
+
+
+def enable_keyboard_input():
+    pass
+
+
+class dudraw:
+    """The object-style API: d = dudraw.dudraw(); d.fgcolor(r, g, b); d.plot(x, y); d.update()."""
+    def fgcolor(self, r, g, b):
+        _canvas.pen = Color(r, g, b).rgb()
+
+    def plot(self, x, y):
+        _canvas.dot(_canvas.px(x), _canvas.py(y))
+
+    def update(self):
+        _canvas.show()
+
+
+def __getattr__(name):
+    raise AttributeError(f"module 'dudraw' has no attribute {name!r} (it is not in the DuDraw catalog)")
+
+
+# --- PNG Output ---
+def _png_chunk(tag: bytes, data: bytes):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def encode_png(width: int, height: int, rgb: bytes, max_size: int = None):
+    """
+    Encodes an RGB buffer as an 8-bit truecolor PNG. With max_size, the image is first
+    shrunk (nearest neighbour) so that neither side exceeds it.
+    """
+    if max_size and max(width, height) > max_size:
+        factor = max_size / max(width, height)
+        out_width, out_height = max(1, int(width * factor)), max(1, int(height * factor))
+        columns = [int(x / factor) * 3 for x in range(out_width)]
+        rows = []
+        for y in range(out_height):
+            offset = int(y / factor) * width * 3
+            rows.append(b"".join(rgb[offset + column:offset + column + 3] for column in columns))
+        width, height = out_width, out_height
+    else:
+        stride = width * 3
+        rows = [rgb[y * stride:(y + 1) * stride] for y in range(height)]
+    # Filter type 0 (none) before every row
+    raw = b"".join(b"\x00" + row for row in rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(raw, 6)) + _png_chunk(b"IEND", b"")
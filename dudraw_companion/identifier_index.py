@@ -0,0 +1,110 @@
+import re
+
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+from .catalog_artifact import build_catalog_documents
+from .lexical_index import tokenize
+
+
+def normalize_identifier(text: str) -> str:
+    """
+    Canonical lookup key for an identifier-like query.
+    "`dudraw.Filled_Rectangle(x, y, w, h)`", "dudraw.filled_rectangle" and "filled rectangle"
+    all normalize to the same form (modulo the "dudraw." prefix).
+    """
+    key = text.strip().strip("`'\"").strip().lower()
+    key = key.split("(", 1)[0]
+    key = key.replace("_", " ")
+    return re.sub(r"\s+", " ", key).strip()
+
+
+# --- Exact Identifier Index ---
+class IdentifierIndex:
+    """
+    A precomputed dictionary from function ids, short names and keyword phrases to catalog entries.
+
+    Exact lookups are O(1) and deterministic, and return the matching entry together with its
+    precomputed "see also" neighbours, without any vector query.
+    """
+    def __init__(self, functions=DU_DRAW_FUNCTIONS, related_count: int = 3):
+        _, self.metadatas, self.ids = build_catalog_documents(functions)
+
+        # Identifiers (full id and short name) map to exactly one entry
+        self.identifiers = {}
+        # Curated keyword phrases may be shared by several entries
+        self.phrases = {}
+        for doc_index, func in enumerate(functions):
+            full_id = normalize_identifier(func["id"])
+            for key in (full_id, full_id.rsplit(".", 1)[-1]):
+                self.identifiers.setdefault(key, doc_index)
+            for keyword in func.get("keywords", []):
+                self.phrases.setdefault(normalize_identifier(keyword), []).append(doc_index)
+
+        self.see_also = self._build_see_also(functions, related_count)
+
+    def _build_see_also(self, functions, related_count: int):
+        """
+        Related entries for each catalog entry: first the catalog ids its example uses
+        (e.g. dudraw.RED -> dudraw.set_pen_color), then the entries sharing the most terms.
+        """
+        positions = {func["id"]: doc_index for doc_index, func in enumerate(functions)}
+        terms = []
+        for func in functions:
+            text = " ".join([func["description"], func["syntax"], " ".join(func.get("keywords", []))])
+            terms.append(set(tokenize(text)))
+
+        see_also = []
+        for doc_index, func in enumerate(functions):
+            related = []
+            for function_id in re.findall(r"\b[a-z]+\.[A-Za-z_]+", func.get("example", "")):
+                other = positions.get(function_id)
+                if other is not None and other != doc_index and other not in related:
+                    related.append(other)
+
+            similarities = sorted(
+                (
+                    (len(terms[doc_index] & terms[other]) / len(terms[doc_index] | terms[other]), other)
+                    for other in range(len(functions))
+                    if other != doc_index and other not in related and terms[doc_index] | terms[other]
+                ),
+                key=lambda item: (-item[0], item[1])
+            )
+            related.extend(other for similarity, other in similarities if similarity > 0)
+            see_also.append(related[:related_count])
+        return see_also
+
+    def to_state(self):
+        """The built index as JSON-serializable data, for the warm-start snapshot."""
+        return {"identifiers": self.identifiers, "phrases": self.phrases, "see_also": self.see_also}
+
+    @classmethod
+    def from_state(cls, state, metadatas, ids):
+        """Restores an index saved with to_state without recomputing the "see also" neighbours."""
+        index = cls.__new__(cls)
+        index.metadatas = metadatas
+        index.ids = ids
+        index.identifiers = state["identifiers"]
+        index.phrases = state["phrases"]
+        index.see_also = state["see_also"]
+        return index
+
+    def lookup(self, query: str):
+        """Returns the catalog positions matching the query exactly (best first), or None."""
+        key = normalize_identifier(query)
+        if key in self.identifiers:
+            return [self.identifiers[key]]
+        if key.startswith("dudraw ") and key[len("dudraw "):] in self.identifiers:
+            return [self.identifiers[key[len("dudraw "):]]]
+        return self.phrases.get(key)
+
+    def query(self, query: str, n_results: int = 6):
+        """
+        Returns the metadata of the exactly matching entries followed by their "see also" entries,
+        or None if the query is not a known identifier or keyword phrase.
+        """
+        matches = self.lookup(query)
+        if not matches:
+            return None
+        results = list(matches)
+        for doc_index in matches:
+            results.extend(other for other in self.see_also[doc_index] if other not in results)
+        return [self.metadatas[doc_index] for doc_index in results[:n_results]]
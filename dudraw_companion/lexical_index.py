@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter
+
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+from .catalog_artifact import build_catalog_documents
+
+# Words that carry no meaning for function lookup
+STOP_WORDS = {
+    "a", "an", "and", "the", "to", "of", "for", "in", "on", "with", "is", "it", "by",
+    "how", "do", "i", "me", "use", "using", "function", "functions", "dudraw"
+}
+
+# Catalog fields and how many times their tokens count towards an entry's term frequencies
+FIELD_WEIGHTS = {"id": 3, "keywords": 2, "syntax": 1, "description": 1}
+
+
+def _normalize_token(token: str) -> str:
+    """Light plural stemming so "circles" matches "circle" and "keys" matches "key"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    """
+    Splits text into search tokens, understanding Python identifiers.
+    "dudraw.set_pen_color_rgb(r, g, b)" yields the whole identifier "set_pen_color_rgb"
+    as well as its parts "set", "pen", "color" and "rgb".
+    """
+    tokens = []
+    for word in re.findall(r"[a-z0-9_]+", text.lower()):
+        parts = [part for part in word.split("_") if part]
+        if len(parts) > 1:
+            tokens.append(word)
+        for part in parts:
+            if part not in STOP_WORDS:
+                tokens.append(_normalize_token(part))
+    return tokens
+
+
+# --- BM25 Lexical Index ---
+class LexicalIndex:
+    """
+    A BM25 index over the DuDraw function catalog's ids, keywords, syntax and descriptions.
+    Answers queries in well under a millisecond without any network calls.
+    """
+    def __init__(self, functions=DU_DRAW_FUNCTIONS, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        _, self.metadatas, self.ids = build_catalog_documents(functions)
+
+        self.doc_lengths = []
+        self.postings = {}
+        for doc_index, func in enumerate(functions):
+            term_counts = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                value = func.get(field, "")
+                if isinstance(value, list):
+                    value = " ".join(value)
+                for token in tokenize(value):
+                    term_counts[token] += weight
+            self.doc_lengths.append(sum(term_counts.values()))
+            for token, count in term_counts.items():
+                self.postings.setdefault(token, []).append((doc_index, count))
+
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        doc_count = len(self.ids)
+        self.idf = {
+            token: math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for token, postings in self.postings.items()
+        }
+
+    def to_state(self):
+        """The built index as JSON-serializable data, for the warm-start snapshot."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "avg_doc_length": self.avg_doc_length,
+            "postings": self.postings,
+            "idf": self.idf
+        }
+
+    @classmethod
+    def from_state(cls, state, metadatas, ids):
+        """Restores an index saved with to_state without re-tokenizing the catalog."""
+        index = cls.__new__(cls)
+        index.k1 = state["k1"]
+        index.b = state["b"]
+        index.metadatas = metadatas
+        index.ids = ids
+        index.doc_lengths = state["doc_lengths"]
+        index.avg_doc_length = state["avg_doc_length"]
+        index.postings = state["postings"]
+        index.idf = state["idf"]
+        return index
+
+    def count(self):
+        return len(self.ids)
+
+    def rank(self, query: str, n_results: int = 6):
+        """Returns up to n_results (doc_index, score) pairs, best first. Entries with no matching token are omitted."""
+        scores = {}
+        for token in set(tokenize(query)):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            for doc_index, term_frequency in self.postings[token]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_index] / self.avg_doc_length
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * term_frequency * (self.k1 + 1) / (term_frequency + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n_results]
+
+    def query(self, query: str, n_results: int = 6):
+        """Returns the metadata of the best matching catalog entries for a query."""
+        return [self.metadatas[doc_index] for doc_index, _ in self.rank(query, n_results)]
+
+
+def reciprocal_rank_fusion(ranked_lists, n_results: int = 6, k: int = 60):
+    """Merges several ranked lists of function metadata into one, scoring each entry by sum(1 / (k + rank))."""
+    scores = {}
+    entries = {}
+    for ranked in ranked_lists:
+        for rank, meta in enumerate(ranked):
+            scores[meta["id"]] = scores.get(meta["id"], 0.0) + 1.0 / (k + rank + 1)
+            entries.setdefault(meta["id"], meta)
+    best = sorted(scores, key=lambda function_id: -scores[function_id])[:n_results]
+    return [entries[function_id] for function_id in best]
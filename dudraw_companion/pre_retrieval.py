@@ -0,0 +1,104 @@
+"""
+Speculative retrieval of the user's goal, started before the first LLM call.
+
+Almost every run begins with the model asking retrieve_dudraw_functions about the user's
+goal. With PRE_RETRIEVAL enabled, the agent runs that retrieval in a background thread
+while the first completion is in flight, instead of after it:
+
+- "speculative": the result is kept aside and served for the model's first retrieval if that
+  asks for the same functions. The model rephrases the goal ("draw a red circle" becomes
+  "set pen color circle"), so queries are compared by what they retrieve: their offline BM25
+  rankings must share at least PRE_RETRIEVAL_MIN_OVERLAP of the model query's top entries.
+- "inject": the first LLM call never waits for it. Before each LLM call the agent adds the
+  result to the context as an earlier retrieval call if it is ready by then (usually from
+  step 2 on) and the model has not retrieved anything yet, so the model can often skip that step
+
+Either way a run uses its speculative retrieval at most once.
+"""
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from . import config, tracing
+from .response_cache import normalize_prompt
+
+PRE_RETRIEVAL_MODES = ("off", "speculative", "inject")
+# tool_call_id of the retrieval call added to the context in "inject" mode
+INJECTED_TOOL_CALL_ID = "call_pre_retrieval"
+
+
+class PreRetrieval:
+    """One run's speculative retrieval of its goal, running on the agent's executor."""
+    def __init__(self, retriever, executor: ThreadPoolExecutor, user_goal: str, n_results: int):
+        self.query = user_goal
+        self.n_results = n_results
+        self._normalized_query = normalize_prompt(user_goal)
+        self._retriever = retriever
+        self._goal_entries = None
+        self._claimed = False
+        self._lock = threading.Lock()
+        # Run in a copy of the caller's context so the spans land in this request's trace
+        self.future = executor.submit(contextvars.copy_context().run, self._retrieve)
+
+    def _retrieve(self):
+        with tracing.span("pre_retrieval", k=self.n_results):
+            return self._retriever.retrieve_functions(self.query, self.n_results)
+
+    def _ranked_entries(self, query: str):
+        return {doc_index for doc_index, _ in self._retriever.lexical_index.rank(query, self.n_results)}
+
+    def matches(self, query: str, min_overlap: float = config.PRE_RETRIEVAL_MIN_OVERLAP):
+        """Whether a retrieval the model asked for would find the same functions as the one already running."""
+        query = query or ""
+        if normalize_prompt(query) == self._normalized_query:
+            return True
+        entries = self._ranked_entries(query)
+        if not entries:
+            return False
+        if self._goal_entries is None:
+            self._goal_entries = self._ranked_entries(self.query)
+        return len(entries & self._goal_entries) / len(entries) >= min_overlap
+
+    def claim(self):
+        """True for the first caller only: the retrieval is then served or injected, and never again."""
+        with self._lock:
+            claimed, self._claimed = self._claimed, True
+        return not claimed
+
+    def ready(self):
+        """Whether the retrieval has finished (successfully or not)."""
+        return self.future.done()
+
+    def result(self, timeout: float = None):
+        """
+        The formatted retrieval, or None if it failed or is not done within timeout seconds.
+        Failed retrievals are not served: the caller falls back to a regular tool call.
+        """
+        try:
+            observation = self.future.result(timeout)
+        except FutureTimeoutError:
+            return None
+        except Exception as e:
+            print(f"Speculative retrieval failed: {e}")
+            return None
+        return None if observation.startswith("Error:") else observation
+
+
+def create_pre_retrieval_executor(mode: str = config.PRE_RETRIEVAL):
+    """The agent's executor for speculative retrievals, or None when PRE_RETRIEVAL is off."""
+    if mode not in PRE_RETRIEVAL_MODES:
+        raise ValueError(f"Unknown PRE_RETRIEVAL mode {mode!r}; expected one of {', '.join(PRE_RETRIEVAL_MODES)}")
+    if mode == "off":
+        return None
+    return ThreadPoolExecutor(max_workers=config.PRE_RETRIEVAL_WORKERS, thread_name_prefix="pre-retrieval")
+
+
+def injected_tool_call(user_goal: str):
+    """The assistant tool call that precedes an injected retrieval in the conversation history."""
+    return {
+        "id": INJECTED_TOOL_CALL_ID,
+        "type": "function",
+        "function": {"name": "retrieve_dudraw_functions", "arguments": json.dumps({"query": user_goal})}
+    }
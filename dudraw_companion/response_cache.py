@@ -0,0 +1,209 @@
+"""
+Exact cache of complete agent runs, keyed by the normalized prompt.
+
+Keys are SHA-256 hashes of the normalized prompt (NFKC, lower case, collapsed whitespace,
+no trailing punctuation; see normalize_prompt) together with the model, the system prompt
+hash and the catalog hash, so an answer is never served for a different configuration.
+Values are the run's messages as JSON, stored only for runs ending in a final answer.
+
+Backends (RESPONSE_CACHE_BACKEND):
+
+- "memory": an in-process LRU with per-entry expiry; each worker process has its own.
+- "sqlite": a local file shared by the processes on one machine, with expiry and LRU trimming.
+- "redis": any Redis-compatible server shared by every instance; expiry uses Redis TTLs.
+
+A failing backend (sqlite3 or Redis errors) is reported and treated as a miss, so the agent
+still answers; other exceptions are bugs and propagate.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a user prompt: case, whitespace and trailing punctuation do not matter."""
+    prompt = unicodedata.normalize("NFKC", prompt).lower()
+    prompt = re.sub(r"\s+", " ", prompt).strip()
+    return prompt.rstrip(".!?").strip()
+
+
+def response_cache_key(prompt: str, model: str, system_prompt_hash: str, catalog_hash: str) -> str:
+    """Cache key for a complete agent run."""
+    payload = json.dumps([normalize_prompt(prompt), model, system_prompt_hash, catalog_hash])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- Cache Backends ---
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry expiry."""
+    # Exceptions that mean the backend is unavailable (none for an in-process dict)
+    errors = ()
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Persistent cache in a local SQLite file, shared by all worker processes on the machine."""
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            now = time.time()
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            excess = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+            self._db.commit()
+
+    def size(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """
+    Cache in Redis or any Redis-compatible server (e.g. a local Valkey or KeyDB instance).
+    Expiry uses Redis TTLs; LRU eviction is left to the server's maxmemory-policy.
+    """
+    def __init__(self, client, prefix: str = "dudraw:response:"):
+        # Imported lazily: only this backend needs the redis package
+        from redis.exceptions import RedisError
+        self.errors = (RedisError,)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl_seconds)))
+
+    def size(self):
+        return None
+
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    Stores the final messages of complete agent runs, so repeated prompts return in milliseconds.
+    Only successful runs (ending in a final answer) are stored.
+    """
+    def __init__(self, backend, ttl_seconds: float = 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str):
+        try:
+            value = self.backend.get(key)
+        except self.backend.errors as e:
+            print(f"Response cache lookup failed: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, messages):
+        if not messages or messages[-1].get("type") != "final":
+            return
+        try:
+            self.backend.set(key, json.dumps(messages, ensure_ascii=False), self.ttl_seconds)
+        except self.backend.errors as e:
+            print(f"Response cache store failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": self.backend.size(),
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+def create_response_cache(backend: str, ttl_seconds: float = 3600, max_entries: int = 1000, path: str = None, redis_url: str = None):
+    """Builds the response cache selected by configuration; returns None when caching is turned off."""
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return ResponseCache(MemoryCacheBackend(max_entries), ttl_seconds)
+    if backend == "sqlite":
+        return ResponseCache(SQLiteCacheBackend(path, max_entries), ttl_seconds)
+    if backend == "redis":
+        import redis
+        return ResponseCache(RedisCacheBackend(redis.Redis.from_url(redis_url)), ttl_seconds)
+    raise ValueError(f"Unknown response cache backend '{backend}'. Use 'memory', 'sqlite', 'redis' or 'off'.")
@@ -0,0 +1,211 @@
+"""
+Retrieval of DuDraw function documentation for the agent's `retrieve_dudraw_functions` tool.
+
+Only the configured backend's dependencies are imported: chromadb for the "chroma"
+backend, numpy for the "numpy" backend, neither in "lexical" mode.
+"""
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+
+from . import config, tracing
+from .catalog_artifact import build_catalog_documents, catalog_hash, load_catalog_embeddings, write_catalog_embeddings
+from .embedding_cache import CachingEmbeddingFunction, OpenAIEmbedder, as_chroma_embedding_function
+from .lexical_index import reciprocal_rank_fusion
+from .warm_start import catalog_indexes
+
+def _merge_results(first, rest, n_results: int):
+    """Metadata from first, then from rest, without repeating a function id, up to n_results entries."""
+    merged = list(first)
+    seen = {metadata["id"] for metadata in merged}
+    for metadata in rest:
+        if len(merged) >= n_results:
+            break
+        if metadata["id"] not in seen:
+            seen.add(metadata["id"])
+            merged.append(metadata)
+    return merged
+
+
+# --- Tool 1: DuDraw Function Retriever ---
+class DuDrawFunctionRetriever:
+    """
+    A tool to retrieve relevant DuDraw function information.
+    Modes: "dense" searches embeddings in a vector store, either a ChromaDB collection ("chroma")
+    or an in-process NumPy index ("numpy"); "lexical" uses the offline BM25 index; "hybrid"
+    merges both rankings with reciprocal-rank fusion.
+    """
+    def __init__(self, backend: str = config.RETRIEVER_BACKEND, mode: str = config.RETRIEVER_MODE,
+                 embedding_cache_path: str = config.EMBEDDING_CACHE_PATH, chroma_path: str = config.CHROMA_PATH):
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"Unknown retriever mode '{mode}'. Use 'dense', 'lexical' or 'hybrid'.")
+        self.mode = mode
+        self.backend = backend
+        # Restored from the warm-start snapshot when one matches the catalog, otherwise built
+        self.snapshot, self.lexical_index, self.identifier_index = catalog_indexes()
+        self.warm_start = self.snapshot is not None
+        if mode == "lexical":
+            # Fully offline: no embedding function or vector store is needed
+            self.embedding_function = None
+            return
+
+        # Cache query embeddings on disk so repeated queries skip the embeddings API
+        self.embedding_function = CachingEmbeddingFunction(
+            OpenAIEmbedder(config.EMBEDDING_MODEL_NAME, api_key=config.OPENAI_API_KEY, timeout=config.EMBEDDING_TIMEOUT_SECONDS),
+            model_name=config.EMBEDDING_MODEL_NAME,
+            path=embedding_cache_path
+        )
+        self.catalog_hash = catalog_hash(config.EMBEDDING_MODEL_NAME)
+
+        if backend == "numpy":
+            # Imported lazily so the chroma backend and lexical mode never pay for numpy
+            from .vector_index import VectorIndex
+            if self.snapshot is not None and self.snapshot["matrix"] is not None:
+                # Memory-mapped and already normalized: nothing to embed, copy or normalize
+                self.index = VectorIndex(self.snapshot["ids"], self.snapshot["matrix"], self.snapshot["metadatas"], normalized=True)
+            else:
+                embeddings, _, metadatas, ids = self._catalog_embeddings()
+                self.index = VectorIndex(ids, embeddings, metadatas)
+            print(f"Loaded {self.index.count()} DuDraw functions into the in-process vector index")
+        elif backend == "chroma":
+            # Imported lazily so the numpy backend never pays for chromadb
+            from chromadb import PersistentClient
+            self.chroma_client = PersistentClient(path=chroma_path)
+            self.collection_name = "du_draw_functions_collection"
+            self.collection = self._get_collection()
+            self.populate_functions()
+        else:
+            raise ValueError(f"Unknown retriever backend '{backend}'. Use 'chroma' or 'numpy'.")
+
+    def _catalog_embeddings(self):
+        """
+        Returns (embeddings, documents, metadatas, ids) for the function catalog.
+        Uses the precomputed catalog artifact when it matches the current catalog, so no
+        embeddings API calls are needed; otherwise embeds the catalog and writes the artifact.
+        """
+        artifact = load_catalog_embeddings(config.EMBEDDING_MODEL_NAME)
+        if artifact is not None:
+            print(f"Loaded precomputed embeddings for catalog {self.catalog_hash}")
+            return artifact["embeddings"], artifact["documents"], artifact["metadatas"], artifact["ids"]
+
+        documents, metadatas, ids = build_catalog_documents()
+        embeddings = self.embedding_function(documents)
+        try:
+            write_catalog_embeddings(embeddings, config.EMBEDDING_MODEL_NAME)
+        except OSError as e:
+            print(f"Could not write catalog embeddings artifact: {e}")
+        return embeddings, documents, metadatas, ids
+
+    def _get_collection(self):
+        return self.chroma_client.get_or_create_collection(
+            self.collection_name,
+            embedding_function=as_chroma_embedding_function(self.embedding_function),
+            metadata={"catalog_hash": self.catalog_hash}
+        )
+
+    def populate_functions(self):
+        """
+        Populates the ChromaDB collection with DuDraw function data from du_draw_functions_data.py.
+        The collection is rebuilt only when the catalog hash changes.
+        """
+        if self.collection.count() > 0:
+            if (self.collection.metadata or {}).get("catalog_hash") == self.catalog_hash:
+                print(f"ChromaDB already contains {self.collection.count()} DuDraw functions")
+                return
+            print("DuDraw function catalog changed, rebuilding ChromaDB collection...")
+            self.chroma_client.delete_collection(self.collection_name)
+            self.collection = self._get_collection()
+
+        print(f"Loading {len(DU_DRAW_FUNCTIONS)} DuDraw functions from data file...")
+        embeddings, documents, metadatas, ids = self._catalog_embeddings()
+        self.collection.add(
+            embeddings=[list(map(float, embedding)) for embedding in embeddings],
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+        print(f"Successfully loaded {len(DU_DRAW_FUNCTIONS)} DuDraw functions into ChromaDB")
+
+    def count(self):
+        """Number of DuDraw functions available for retrieval."""
+        if self.mode == "lexical":
+            return self.lexical_index.count()
+        if self.backend == "numpy":
+            return self.index.count()
+        return self.collection.count()
+
+    def _dense_query_many(self, queries, n_results: int):
+        if self.backend == "numpy":
+            vectors = self.embedding_function(queries)
+            with tracing.span("vector_query", backend="numpy", queries=len(queries)):
+                return self.index.query_many(vectors, n_results)
+        # Chroma embeds the query texts itself, so this span includes the embedding span
+        with tracing.span("vector_query", backend="chroma", queries=len(queries)):
+            results = self.collection.query(
+                query_texts=list(queries),
+                n_results=n_results,
+                include=['metadatas']
+            )
+        return results['metadatas'] if results and results['metadatas'] else [[] for _ in queries]
+
+    def query_many(self, queries, n_results: int = 6):
+        """
+        Returns the metadata of the top N matching functions for each query in a batch.
+        Queries naming a function exactly (id, short name, keyword phrase or constant) get the
+        identifier index's entries and their "see also" neighbours first, followed by the search
+        results; only a query answered in full by the identifier index skips search.
+        """
+        with tracing.span("retrieval", mode=self.mode, queries=len(queries)) as retrieval_span:
+            results = [self.identifier_index.query(query, n_results) for query in queries]
+            retrieval_span.set("identifier_hits", sum(result is not None for result in results))
+            pending = [i for i, result in enumerate(results) if result is None or len(result) < n_results]
+            if pending:
+                for i, found in zip(pending, self._search_many([queries[i] for i in pending], n_results)):
+                    results[i] = _merge_results(results[i] or [], found, n_results)
+        return results
+
+    def _search_many(self, queries, n_results: int):
+        if self.mode == "lexical":
+            return [self.lexical_index.query(query, n_results) for query in queries]
+
+        # Hybrid mode fuses deeper candidate lists from both retrievers
+        candidates = n_results * 2 if self.mode == "hybrid" else n_results
+        try:
+            dense_results = self._dense_query_many(queries, candidates)
+        except Exception as e:
+            # The embeddings API is slow or down: answer from the offline lexical index instead
+            print(f"Dense retrieval failed, falling back to lexical retrieval: {e}")
+            return [self.lexical_index.query(query, n_results) for query in queries]
+
+        if self.mode == "dense":
+            return dense_results
+        return [
+            reciprocal_rank_fusion([dense, self.lexical_index.query(query, candidates)], n_results)
+            for query, dense in zip(queries, dense_results)
+        ]
+
+    def retrieve_functions(self, query: str, n_results: int = 6):
+        """
+        Retrieves the top N most relevant DuDraw function metadata based on a natural language query.
+        This pulls from the DU_DRAW_FUNCTIONS data loaded from du_draw_functions_data.py
+        """
+        try:
+            retrieved_functions = self.query_many([query], n_results)[0]
+            formatted_retrieval = self._format_retrieved_tools_for_llm_response(retrieved_functions)
+            return formatted_retrieval
+        except Exception as e:
+            return f"Error: Could not retrieve functions: {e}"
+
+    def _format_retrieved_tools_for_llm_response(self, tools_list):
+        """Helper to format retrieved functions for LLM consumption as observation."""
+        if not tools_list:
+            return "No specific DuDraw functions were found for this request."
+        formatted_list = []
+        for tool in tools_list:
+            formatted_list.append(
+                f"Function ID: {tool.get('id', 'N/A')}\n"
+                f"Description: {tool.get('description', 'N/A')}\n"
+                f"Syntax: {tool.get('syntax', 'N/A')}\n"
+                f"Parameters: {tool.get('params', 'N/A')}\n"
+                f"Example: {tool.get('example', 'N/A')}\n"
+                "---"
+            )
+        return "\n".join(formatted_list)
@@ -0,0 +1,167 @@
+"""
+A safe arithmetic evaluator for the calculate_expression tool.
+
+Expressions are parsed with `ast` and only numbers, arithmetic operators and a whitelist of
+`math` functions and constants are accepted (`2 + 2`, `15 * 3 / 2`, `math.sqrt(9)`, `sqrt(9)`,
+`pi * 0.25 ** 2`). Nothing else, such as names, attributes or imports, can be reached. Powers
+and factorials are bounded so results stay small, evaluation is bounded in time, and compiled
+expressions are kept in an LRU cache.
+"""
+import ast
+import math
+import operator
+import time
+from functools import lru_cache
+
+MAX_EXPRESSION_LENGTH = 500
+MAX_NODES = 200
+# Integer results may have at most this many digits (9**9**9 would have ~370 million)
+MAX_RESULT_DIGITS = 1000
+MAX_FACTORIAL = 400
+MAX_EVALUATION_SECONDS = 0.05
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: None,  # bounded, see _power
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+    "inf": math.inf,
+}
+
+
+def _factorial(n):
+    if not float(n).is_integer() or not 0 <= n <= MAX_FACTORIAL:
+        raise ValueError(f"factorial() is limited to whole numbers from 0 to {MAX_FACTORIAL}")
+    return math.factorial(int(n))
+
+
+FUNCTIONS = {
+    name: getattr(math, name)
+    for name in (
+        "sqrt", "exp", "log", "log10", "log2", "sin", "cos", "tan", "asin", "acos", "atan", "atan2",
+        "sinh", "cosh", "tanh", "degrees", "radians", "hypot", "floor", "ceil", "fabs", "trunc", "gcd"
+    )
+}
+FUNCTIONS.update({
+    "pow": lambda base, exponent: _power(base, exponent),
+    "factorial": _factorial,
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+})
+
+
+class EvaluationError(ValueError):
+    """The expression is not allowed or could not be evaluated within its limits."""
+
+
+def _check_size(value):
+    if isinstance(value, int) and value.bit_length() > MAX_RESULT_DIGITS * 3.33:
+        raise EvaluationError(f"result has more than {MAX_RESULT_DIGITS} digits")
+    return value
+
+
+def _power(base, exponent):
+    """base ** exponent, refusing integer results that would exceed MAX_RESULT_DIGITS."""
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log10(abs(base)) > MAX_RESULT_DIGITS:
+            raise EvaluationError(f"result has more than {MAX_RESULT_DIGITS} digits")
+    return _check_size(base ** exponent)
+
+
+def _check_deadline(deadline):
+    if time.perf_counter() > deadline:
+        raise EvaluationError(f"evaluation took longer than {MAX_EVALUATION_SECONDS} seconds")
+
+
+def _compile_node(node):
+    """Turns a validated AST node into a closure evaluating it; raises EvaluationError for anything not whitelisted."""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body)
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise EvaluationError(f"only numbers are allowed, not {node.value!r}")
+        value = node.value
+        return lambda deadline: value
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        if isinstance(node.op, ast.Pow):
+            def evaluate(deadline):
+                _check_deadline(deadline)
+                return _power(left(deadline), right(deadline))
+        else:
+            apply = BINARY_OPERATORS[type(node.op)]
+            def evaluate(deadline):
+                _check_deadline(deadline)
+                return _check_size(apply(left(deadline), right(deadline)))
+        return evaluate
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        operand, apply = _compile_node(node.operand), UNARY_OPERATORS[type(node.op)]
+        return lambda deadline: apply(operand(deadline))
+
+    name = _function_or_constant_name(node)
+    if name is not None:
+        if name not in CONSTANTS:
+            raise EvaluationError(f"unknown name '{name}'")
+        value = CONSTANTS[name]
+        return lambda deadline: value
+
+    if isinstance(node, ast.Call) and not node.keywords:
+        function_name = _function_or_constant_name(node.func)
+        if function_name not in FUNCTIONS:
+            raise EvaluationError(f"function '{function_name or ast.unparse(node.func)}' is not allowed")
+        function = FUNCTIONS[function_name]
+        arguments = [_compile_node(argument) for argument in node.args]
+        def evaluate(deadline):
+            _check_deadline(deadline)
+            return _check_size(function(*(argument(deadline) for argument in arguments)))
+        return evaluate
+
+    raise EvaluationError(f"'{ast.unparse(node)}' is not allowed in a calculation")
+
+
+def _function_or_constant_name(node):
+    """"sqrt" for both `sqrt` and `math.sqrt`; None for any other kind of node."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "math":
+        return node.attr
+    return None
+
+
+@lru_cache(maxsize=256)
+def compile_expression(expression: str):
+    """Parses and validates an expression once; the returned closure takes an evaluation deadline."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise EvaluationError(f"expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise EvaluationError(f"invalid syntax: {e.msg}") from None
+    if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+        raise EvaluationError(f"expression has more than {MAX_NODES} parts")
+    return _compile_node(tree)
+
+
+def safe_eval(expression: str, timeout: float = MAX_EVALUATION_SECONDS):
+    """Evaluates an arithmetic expression; raises EvaluationError, ZeroDivisionError, OverflowError or ValueError."""
+    evaluate = compile_expression(expression)
+    return evaluate(time.perf_counter() + timeout)
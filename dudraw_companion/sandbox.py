@@ -0,0 +1,201 @@
+"""
+Preview sandbox: runs generated DuDraw programs headlessly and renders their last frame to PNG.
+
+A pool of long-lived worker interpreters (sandbox_worker.py) is started once and reused, so
+a preview costs the program's own run time rather than interpreter startup. Each program runs
+restricted, in a child process forked by its worker, with a CPU-time, memory and frame budget
+(see sandbox_worker.py for the confinement); a worker that does not answer within the
+wall-clock timeout (e.g. a program sleeping forever) is killed and replaced. Workers are also
+replaced after SANDBOX_MAX_JOBS_PER_WORKER programs.
+
+Result of run():
+
+    {"status": "ok" | "frame_limit" | "cpu_limit" | "memory_limit" | "error" | "timeout" | "busy" | "crashed",
+     "error": str | None, "line": int | None, "frames": int, "width": int, "height": int,
+     "png": base64 str | None, "output": str, "cpu_ms": float, "wall_ms": float}
+
+"ok" and "frame_limit" (a game loop stopped after its frame budget) are successful runs.
+"""
+import json
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import config, tracing
+from .code_validator import extract_code_blocks
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUCCESSFUL_STATUSES = ("ok", "frame_limit")
+WORKER_STATUSES = SUCCESSFUL_STATUSES + ("cpu_limit", "memory_limit", "error")
+
+
+def check_sandbox_user(user: str = config.SANDBOX_USER):
+    """
+    Raises ValueError if the server runs as root and user does not exist: workers could not drop
+    privileges, would exit on startup and be respawned for every preview.
+    """
+    if not user or not hasattr(os, "geteuid") or os.geteuid() != 0:
+        return
+    import pwd
+    try:
+        pwd.getpwnam(user)
+    except KeyError:
+        raise ValueError(f"Preview sandbox misconfigured: SANDBOX_USER {user!r} does not exist on this host. "
+                         "Create the account or set SANDBOX_USER to an existing unprivileged user.")
+
+
+class _Worker:
+    """One worker interpreter and its pipes."""
+    def __init__(self, memory_mb: int, user: str = config.SANDBOX_USER):
+        # No inherited environment: the program must never see API keys or other secrets
+        env = {"PATH": os.defpath, "PYTHONPATH": REPO_DIR, "PYTHONDONTWRITEBYTECODE": "1"}
+        # Programs run in a scratch directory (files can be created there, but not written to)
+        self.workdir = tempfile.mkdtemp(prefix="dudraw-sandbox-")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "dudraw_companion.sandbox_worker", str(memory_mb), user],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=self.workdir, env=env
+        )
+        self.jobs = 0
+        self._buffer = b""
+
+    def request(self, job: dict, timeout: float):
+        """Sends a job and waits for its reply; raises TimeoutError or OSError if the worker does not answer."""
+        self.jobs += 1
+        self.process.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Sandbox worker did not answer in time")
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if readable:
+                data = os.read(fd, 65536)
+                if not data:
+                    raise OSError("Sandbox worker exited")
+                self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        # The program shares the worker process, so its replies are untrusted input
+        reply = json.loads(line)
+        if not isinstance(reply, dict) or reply.get("status") not in WORKER_STATUSES:
+            raise ValueError("Malformed reply from sandbox worker")
+        return reply
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SandboxPool:
+    """A fixed number of reusable sandbox workers; safe to share between request threads."""
+    def __init__(self, workers: int = config.SANDBOX_WORKERS, cpu_seconds: float = config.SANDBOX_CPU_SECONDS,
+                 memory_mb: int = config.SANDBOX_MEMORY_MB, max_frames: int = config.SANDBOX_MAX_FRAMES,
+                 timeout_seconds: float = config.SANDBOX_TIMEOUT_SECONDS,
+                 max_jobs_per_worker: int = config.SANDBOX_MAX_JOBS_PER_WORKER,
+                 max_canvas_size: int = config.SANDBOX_MAX_CANVAS_SIZE):
+        self.size = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_frames = max_frames
+        self.timeout_seconds = timeout_seconds
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_canvas_size = max_canvas_size
+        check_sandbox_user()
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(_Worker(memory_mb))
+
+    def run(self, code: str, max_size: int = config.SANDBOX_PREVIEW_SIZE):
+        """Runs a program and returns its result (see the module docstring); max_size bounds the PNG's sides."""
+        start = time.perf_counter()
+        with tracing.span("sandbox") as sandbox_span:
+            try:
+                worker = self._idle.get(timeout=self.timeout_seconds)
+            except queue.Empty:
+                result = {"status": "busy", "error": "All sandbox workers are busy"}
+            else:
+                result = self._run_on(worker, code, max_size)
+            result.setdefault("frames", 0)
+            result.setdefault("png", None)
+            result["wall_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            sandbox_span.set("status", result["status"])
+            sandbox_span.set("frames", result["frames"])
+        tracing.METRICS.inc("dudraw_sandbox_runs_total", status=result["status"])
+        return result
+
+    def _run_on(self, worker: _Worker, code: str, max_size: int):
+        job = {
+            "code": code,
+            "cpu_seconds": self.cpu_seconds,
+            "max_frames": self.max_frames,
+            "max_canvas_size": self.max_canvas_size,
+            "max_size": max_size
+        }
+        try:
+            result = worker.request(job, self.timeout_seconds)
+        except TimeoutError:
+            result = {"status": "timeout", "error": f"Program did not finish within {self.timeout_seconds} s"}
+        except (OSError, ValueError) as e:
+            result = {"status": "crashed", "error": f"Sandbox worker failed: {e}"}
+        if result["status"] in ("timeout", "crashed") or worker.jobs >= self.max_jobs_per_worker:
+            worker.close()
+            worker = _Worker(self.memory_mb)
+        if self._closed:
+            worker.close()
+        else:
+            self._idle.put(worker)
+        return result
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def program_from_answer(content: str):
+    """The program to preview: the answer's first fenced Python block, or the text itself if it has none."""
+    blocks = extract_code_blocks(content)
+    return blocks[0] if blocks else content
+
+
+def final_answer_program(messages):
+    """The program of the final answer among an agent run's messages, or None if the run has no final answer."""
+    final = next((message["content"] for message in reversed(messages or []) if message.get("type") == "final"), None)
+    return program_from_answer(final) if final else None
+
+
+def preview_payload(result: dict):
+    """A run() result for JSON responses: the PNG becomes an `image` data URL."""
+    payload = {key: value for key, value in result.items() if key != "png"}
+    payload["succeeded"] = result["status"] in SUCCESSFUL_STATUSES
+    payload["image"] = f"data:image/png;base64,{result['png']}" if result.get("png") else None
+    return payload
+
+
+# --- Process-wide Pool ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def sandbox_pool():
+    """The process's shared sandbox pool, started on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SandboxPool()
+    return _pool
@@ -0,0 +1,292 @@
+"""
+Preview sandbox worker: runs generated programs against the headless dudraw stand-in.
+
+Started by the pool in sandbox.py as `python -m dudraw_companion.sandbox_worker`, with an
+empty environment (no API keys), and reused for many programs. Each job is one JSON line on
+stdin; each reply is one JSON line on the original stdout. File descriptor 1 is pointed at
+/dev/null so stray writes cannot garble replies.
+
+Programs are untrusted (a prompt can steer what the model writes), so they are confined in layers:
+
+- Restricted Python: the program may only import ALLOWED_MODULES (as copies without their
+  module-valued and private attributes), gets a whitelist of builtins (no open, eval, exec,
+  getattr or __import__), and is rejected before it runs if it touches private or dunder
+  names or frame and code attributes (the usual ways out of a restricted namespace).
+- A fresh child process per program (fork), so nothing a program changes survives it, with
+  address-space, file-size, process and core-dump limits and a CPU-time timer.
+- When started as root, the worker drops to SANDBOX_USER (so it cannot read the server's
+  /proc/<pid>/environ or its files) after trying to leave the network namespace.
+
+The pool enforces a wall-clock timeout on top.
+"""
+import ast
+import base64
+import importlib
+import io
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+import types
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: only the restricted namespace, the CPU timer, the frame budget and the pool's timeout apply
+    resource = None
+
+from . import headless_dudraw
+from .headless_dudraw import FrameLimitReached
+
+MAX_OUTPUT_CHARS = 2000
+
+# Modules programs may import; dudraw is the headless stand-in
+ALLOWED_MODULES = ("dudraw", "math", "random", "time", "string", "itertools", "collections")
+
+SAFE_BUILTINS = (
+    "abs", "all", "any", "bin", "bool", "callable", "chr", "classmethod", "complex", "dict", "divmod",
+    "enumerate", "filter", "float", "format", "frozenset", "hash", "hex", "int", "isinstance",
+    "issubclass", "iter", "len", "list", "map", "max", "min", "next", "oct", "ord", "pow", "print",
+    "property", "range", "repr", "reversed", "round", "set", "slice", "sorted", "staticmethod", "str",
+    "sum", "super", "tuple", "zip", "__build_class__",
+    "ArithmeticError", "AssertionError", "AttributeError", "Exception", "IndexError", "KeyError",
+    "LookupError", "NameError", "NotImplementedError", "OverflowError", "RuntimeError",
+    "StopIteration", "TypeError", "ValueError", "ZeroDivisionError"
+)
+
+# Attributes that lead from ordinary objects to frames, code and other namespaces
+BLOCKED_ATTRIBUTES = frozenset((
+    "gi_frame", "gi_code", "gi_yieldfrom", "cr_frame", "cr_code", "cr_await", "ag_frame", "ag_code",
+    "ag_await", "f_back", "f_builtins", "f_code", "f_globals", "f_locals", "tb_frame", "tb_next", "mro"
+))
+# For super().__init__(...) in programs that define classes
+ALLOWED_DUNDER_ATTRIBUTES = frozenset(("__init__",))
+
+
+class CpuLimitExceeded(BaseException):
+    """Raised from the virtual-time timer's signal handler; a BaseException so programs cannot catch it by accident."""
+
+
+class SandboxViolation(Exception):
+    """A program uses something the sandbox does not allow; lineno points at it."""
+    def __init__(self, message: str, lineno: int = None):
+        super().__init__(message)
+        self.lineno = lineno
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuLimitExceeded()
+
+
+# --- Restricted Namespace ---
+def _public_copy(module):
+    """A copy of a module with only its public, non-module attributes; programs can change it freely."""
+    copy = types.ModuleType(module.__name__)
+    for name, value in vars(module).items():
+        if not name.startswith("_") and not isinstance(value, types.ModuleType):
+            setattr(copy, name, value)
+    return copy
+
+
+def _allowed_module_objects():
+    """The importable modules, loaded now so nothing has to be read from disk after privileges are dropped."""
+    modules = {name: importlib.import_module(name) for name in ALLOWED_MODULES if name != "dudraw"}
+    modules["dudraw"] = headless_dudraw
+    return modules
+
+
+_MODULES = _allowed_module_objects()
+
+
+def _restricted_builtins():
+    import builtins
+    allowed = {name: getattr(builtins, name) for name in SAFE_BUILTINS}
+    # input() sees an empty stdin rather than the pool's next job
+    allowed["input"] = lambda prompt="": ""
+    copies = {}
+
+    def restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name not in _MODULES:
+            raise ImportError(f"Module {name!r} is not available in the preview sandbox")
+        if name not in copies:
+            copies[name] = _public_copy(_MODULES[name])
+            if name == "dudraw":
+                # Unknown names keep the catalog's error message
+                copies[name].__getattr__ = headless_dudraw.__getattr__
+        return copies[name]
+
+    allowed["__import__"] = restricted_import
+    return allowed
+
+
+def check_program(tree: ast.AST):
+    """Raises SandboxViolation for private/dunder names and attributes, and for frame and code attributes."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_DUNDER_ATTRIBUTES and (
+                node.attr.startswith("_") or node.attr in BLOCKED_ATTRIBUTES):
+            raise SandboxViolation(f"Attribute {node.attr!r} is not allowed in the preview sandbox", node.lineno)
+        if isinstance(node, ast.Name) and node.id.startswith("__") and node.id != "__name__":
+            raise SandboxViolation(f"Name {node.id!r} is not allowed in the preview sandbox", node.lineno)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name.startswith("_"):
+                    raise SandboxViolation(f"Name {alias.name!r} is not allowed in the preview sandbox", node.lineno)
+
+
+# --- Process Isolation ---
+def apply_process_limits(memory_mb: int):
+    if resource is None:
+        return
+    memory = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    # Programs may not write files (writes fail with EFBIG instead of killing the process) or start processes
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _leave_network():
+    """Moves the worker into an empty network namespace where the kernel allows it (root or CAP_SYS_ADMIN)."""
+    clone_newnet = 0x40000000
+    try:
+        if hasattr(os, "unshare"):
+            os.unshare(clone_newnet)
+        else:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.unshare(clone_newnet) != 0:
+                raise OSError(ctypes.get_errno(), "unshare failed")
+    except (OSError, AttributeError):
+        # Without namespaces the restricted namespace (no socket module) still applies
+        pass
+
+
+def drop_privileges(user: str):
+    """Becomes user when running as root, so programs cannot read the server's files or /proc entries."""
+    if not user or not hasattr(os, "geteuid") or os.geteuid() != 0:
+        return
+    import pwd
+    try:
+        entry = pwd.getpwnam(user)
+    except KeyError:
+        # Never run programs as root; the pool checks this too, before starting workers
+        raise SystemExit(f"SANDBOX_USER {user!r} does not exist")
+    _leave_network()
+    os.setgroups([])
+    os.setgid(entry.pw_gid)
+    os.setuid(entry.pw_uid)
+
+
+def _error_line(error: BaseException):
+    """Line of the program (not of the stand-in) where an error was raised, if any."""
+    for frame in reversed(traceback.extract_tb(error.__traceback__)):
+        if frame.filename == "<generated>":
+            return frame.lineno
+    return getattr(error, "lineno", None)
+
+
+def run_program(job: dict):
+    """Runs one program and returns the reply: status, frames, PNG (base64) and error details."""
+    headless_dudraw.reset(max_frames=job["max_frames"], max_canvas_size=job["max_canvas_size"])
+    output = io.StringIO()
+    status, error, line = "ok", None, None
+    start = time.process_time()
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = output, output
+    signal.setitimer(signal.ITIMER_VIRTUAL, job["cpu_seconds"])
+    try:
+        tree = ast.parse(job["code"], "<generated>")
+        check_program(tree)
+        code = compile(tree, "<generated>", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": _restricted_builtins()})
+    except FrameLimitReached:
+        # Game loops (`while True: ... dudraw.show()`) end here; the last frame is the preview
+        status = "frame_limit"
+    except CpuLimitExceeded:
+        status, error = "cpu_limit", f"Program used more than {job['cpu_seconds']} s of CPU time"
+    except MemoryError:
+        status, error = "memory_limit", "Program ran out of memory"
+    except SystemExit:
+        pass
+    except SandboxViolation as e:
+        status, error, line = "error", str(e), e.lineno
+    except BaseException as e:
+        status, error, line = "error", f"{type(e).__name__}: {e}", _error_line(e)
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        sys.stdout, sys.stderr = stdout, stderr
+
+    reply = {
+        "status": status,
+        "error": error,
+        "line": line,
+        "frames": headless_dudraw.frames_shown(),
+        "cpu_ms": round((time.process_time() - start) * 1000, 2),
+        "output": output.getvalue()[:MAX_OUTPUT_CHARS]
+    }
+    try:
+        width, height, rgb = headless_dudraw.last_frame()
+        reply.update(width=width, height=height,
+                     png=base64.b64encode(headless_dudraw.encode_png(width, height, rgb, job.get("max_size"))).decode("ascii"))
+    except MemoryError:
+        reply.update(status="memory_limit", error="Program ran out of memory", png=None)
+    return reply
+
+
+def run_isolated(job: dict, memory_mb: int, close_fds=()):
+    """Runs a program in a forked child with the process limits; the worker itself stays untouched."""
+    if not hasattr(os, "fork"):
+        return run_program(job)
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            os.close(read_fd)
+            for fd in close_fds:
+                os.close(fd)
+            # The program must not read the pool's next jobs
+            os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+            apply_process_limits(memory_mb)
+            reply = json.dumps(run_program(job))
+            with os.fdopen(write_fd, "w", encoding="utf-8") as pipe:
+                pipe.write(reply)
+            exit_code = 0
+        finally:
+            os._exit(exit_code)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "r", encoding="utf-8") as pipe:
+        data = pipe.read()
+    os.waitpid(pid, 0)
+    if not data:
+        return {"status": "error", "error": "Program terminated unexpectedly", "line": None, "frames": 0}
+    return json.loads(data)
+
+
+def main():
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    user = sys.argv[2] if len(sys.argv) > 2 else ""
+    # Replies go to a private copy of stdout; fd 1 itself is discarded
+    replies = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    signal.signal(signal.SIGVTALRM, _on_cpu_limit)
+    drop_privileges(user)
+
+    for line in sys.stdin:
+        try:
+            reply = run_isolated(json.loads(line), memory_mb, close_fds=(replies.fileno(),))
+        except Exception as e:
+            reply = {"status": "error", "error": f"Sandbox failure: {e}", "line": None, "frames": 0}
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import numpy as np
+
+from .response_cache import normalize_prompt
+
+# --- Semantic Answer Cache ---
+class SemanticAnswerCache:
+    """
+    Returns stored answers for paraphrased goals ("draw a crimson circle" vs "make a red circle").
+
+    Each answered goal is embedded with the retriever's embedding function and kept in a
+    fixed-size float32 matrix. A lookup is one matrix-vector product; the stored answer of
+    the most similar goal is returned when cosine similarity >= threshold. Entries expire
+    after ttl_seconds, and the least recently used entry is evicted once the cache is full.
+    Storing a goal that is already answered (the same normalized goal, or a paraphrase at or
+    above the threshold) replaces that entry instead of adding a near-duplicate.
+    """
+    def __init__(self, embedding_function, threshold: float = 0.92, ttl_seconds: float = 3600, max_entries: int = 500, near_miss_margin: float = 0.05):
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.near_miss_margin = near_miss_margin
+
+        self._lock = threading.Lock()
+        self._vectors = None  # allocated on the first store, once the embedding size is known
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries = [None] * max_entries
+        self._hits = 0
+        self._misses = 0
+        self._near_misses = 0
+        self._errors = 0
+
+    def _embed(self, goal: str):
+        vector = np.asarray(self.embedding_function([goal])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, goal: str, scope: str):
+        """
+        Returns the messages stored for the most similar earlier goal, or None.
+        Only entries stored under the same scope (model, prompt and catalog version) can match.
+        """
+        try:
+            vector = self._embed(goal)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            with self._lock:
+                self._errors += 1
+                self._misses += 1
+            return None
+
+        with self._lock:
+            now = time.time()
+            for slot, entry in enumerate(self._entries):
+                if entry is not None and (entry["expires_at"] < now or entry["scope"] != scope):
+                    if entry["expires_at"] < now:
+                        self._entries[slot] = None
+                    self._valid[slot] = False
+                elif entry is not None:
+                    self._valid[slot] = True
+
+            if self._vectors is None or not self._valid.any():
+                self._misses += 1
+                return None
+
+            similarities = np.where(self._valid, self._vectors @ vector, -np.inf)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                self._hits += 1
+                entry = self._entries[best]
+                entry["last_used"] = now
+                return entry["messages"]
+
+            self._misses += 1
+            if similarity >= self.threshold - self.near_miss_margin:
+                self._near_misses += 1
+            return None
+
+    def _live(self, entry, scope: str, now: float):
+        return entry is not None and entry["scope"] == scope and entry["expires_at"] >= now
+
+    def _entry(self, goal: str, key: str, scope: str, messages, now: float):
+        return {
+            "goal": goal,
+            "key": key,
+            "scope": scope,
+            "messages": messages,
+            "expires_at": now + self.ttl_seconds,
+            "last_used": now
+        }
+
+    def store(self, goal: str, scope: str, messages):
+        """Stores the messages of a successful run under its goal's embedding, replacing an equivalent entry."""
+        if not messages or messages[-1].get("type") != "final":
+            return
+        key = normalize_prompt(goal)
+        with self._lock:
+            now = time.time()
+            for slot, entry in enumerate(self._entries):
+                if self._live(entry, scope, now) and entry["key"] == key:
+                    # Same goal: its vector is unchanged, so no embedding call is needed
+                    self._entries[slot] = self._entry(goal, key, scope, messages, now)
+                    return
+        try:
+            vector = self._embed(goal)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+            with self._lock:
+                self._errors += 1
+            return
+
+        with self._lock:
+            now = time.time()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._similar_slot(vector, scope, now)
+            if slot is None:
+                slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = self._entry(goal, key, scope, messages, now)
+
+    def _similar_slot(self, vector, scope: str, now: float):
+        """The slot of a live entry in scope whose goal is a paraphrase (similarity >= threshold), or None."""
+        live = np.array([self._live(entry, scope, now) for entry in self._entries])
+        if not live.any():
+            return None
+        similarities = np.where(live, self._vectors @ vector, -np.inf)
+        best = int(np.argmax(similarities))
+        return best if similarities[best] >= self.threshold else None
+
+    def _free_slot(self, now: float):
+        """An empty or expired slot if there is one, otherwise the least recently used entry's slot."""
+        oldest_slot, oldest_used = 0, float("inf")
+        for slot, entry in enumerate(self._entries):
+            if entry is None or entry["expires_at"] < now:
+                return slot
+            if entry["last_used"] < oldest_used:
+                oldest_slot, oldest_used = slot, entry["last_used"]
+        return oldest_slot
+
+    def stats(self):
+        """Hit/miss/near-miss counters for monitoring."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "near_misses": self._near_misses,
+                "errors": self._errors,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": sum(entry is not None for entry in self._entries),
+                "threshold": self.threshold
+            }
@@ -0,0 +1,126 @@
+"""
+Single-flight coalescing of identical in-flight agent runs.
+
+When many students send the same goal within seconds, the first request (the leader) runs
+the agent and the others (followers) wait for its messages instead of starting their own
+runs. Requests are identical when their answer-cache keys match: same normalized goal, model,
+system prompt and catalog. Followers give up after SINGLE_FLIGHT_MAX_WAIT_SECONDS, or when the
+leader fails (e.g. its client disconnected or the run ended in an error instead of a final
+answer), and then run the agent themselves. Requests bypassing the answer cache are not coalesced.
+
+Waiting works from request threads (Flask) and from asyncio tasks (ASGI); asyncio followers
+wait on futures, not on threads.
+"""
+import asyncio
+import threading
+
+from . import config, tracing
+
+
+class _Call:
+    """One in-flight run and the requests waiting for it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.followers = 0
+        self.async_waiters = []
+
+
+def _set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class SingleFlight:
+    """Coalesces concurrent runs with the same key; max_wait_seconds <= 0 turns coalescing off."""
+    def __init__(self, max_wait_seconds: float = config.SINGLE_FLIGHT_MAX_WAIT_SECONDS):
+        self.max_wait_seconds = max_wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counts = {"runs": 0, "followers": 0, "shared": 0, "timeouts": 0, "max_fanout": 0}
+
+    def join(self, key: str):
+        """Returns (call, is_leader). The leader must call finish(); followers call wait() or wait_async()."""
+        if self.max_wait_seconds <= 0:
+            return None, True
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counts["runs"] += 1
+            else:
+                call.followers += 1
+                self._counts["followers"] += 1
+        if leader:
+            tracing.METRICS.inc("dudraw_single_flight_requests_total", role="leader")
+            tracing.record_cache_lookup("single_flight", False)
+            return call, True
+        tracing.METRICS.inc("dudraw_single_flight_requests_total", role="follower")
+        return call, False
+
+    def finish(self, key: str, call: _Call, result=None):
+        """
+        Hands the leader's result to its followers. None (the run failed) or messages that do not
+        end in a final answer (the run ended in an error) send them to run on their own.
+        """
+        if call is None:
+            return
+        if result and result[-1].get("type") != "final":
+            result = None
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.result = result
+            call.done.set()
+            waiters, call.async_waiters = call.async_waiters, []
+            if call.followers > self._counts["max_fanout"]:
+                self._counts["max_fanout"] = call.followers
+                tracing.METRICS.set_gauge("dudraw_single_flight_max_fanout", call.followers)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_set_future_result, future, result)
+
+    def _waited(self, call: _Call, result):
+        """Counts a follower's outcome; returns the result it should use (None: run on its own)."""
+        timed_out = not call.done.is_set()
+        with self._lock:
+            if timed_out:
+                self._counts["timeouts"] += 1
+            elif result is not None:
+                self._counts["shared"] += 1
+        if timed_out:
+            tracing.METRICS.inc("dudraw_single_flight_requests_total", role="timeout")
+        tracing.record_cache_lookup("single_flight", result is not None)
+        return result
+
+    def wait(self, call: _Call):
+        """Blocks until the leader finishes; returns its result, or None on failure or timeout."""
+        call.done.wait(self.max_wait_seconds)
+        return self._waited(call, call.result if call.done.is_set() else None)
+
+    async def wait_async(self, call: _Call):
+        """Asyncio variant of wait()."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if call.done.is_set():
+                _set_future_result(future, call.result)
+            else:
+                call.async_waiters.append((loop, future))
+        try:
+            result = await asyncio.wait_for(future, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            result = None
+        return self._waited(call, result)
+
+    def stats(self):
+        """Counts so far; mean_fanout is the average number of followers per leader run."""
+        with self._lock:
+            counts = dict(self._counts)
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, **counts, "mean_fanout": round(counts["followers"] / counts["runs"], 3) if counts["runs"] else 0.0}
+
+
+def run_outcome(trace):
+    """Cache outcome of a request that ran the agent: "coalesced" if it shared another request's run, else "miss"."""
+    return "coalesced" if trace.cache_lookups.get("single_flight") == "hit" else "miss"
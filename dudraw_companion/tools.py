@@ -1,14 +1,16 @@
+from .safe_eval import safe_eval
+
 # --- Tool 2: Calculator Function ---
 def calculate_expression(expression: str) -> str:
     """Calculates the result of a mathematical expression.
     Args:
-        expression (str): The mathematical expression to evaluate (e.g., "2 + 2", "15 * 3 / 2").
+        expression (str): The mathematical expression to evaluate (e.g., "2 + 2", "15 * 3 / 2", "math.sqrt(9)").
     Returns:
         str: The result of the calculation, or an error message if invalid.
     """
     try:
-        # Evaluate the expression safely using eval() or a more robust parser
-        result = eval(expression)
+        # Parsed and evaluated by the whitelisting AST evaluator, never by eval()
+        result = safe_eval(expression)
         return f"Calculation Result: {result}"
     except Exception as e:
         return f"Error evaluating expression '{expression}': {e}"
@@ -50,10 +52,3 @@ TOOLS_DEFINITIONS = [
         }
     }
 ]
-
-# A dictionary mapping tool names to their actual Python functions
-AVAILABLE_TOOL_FUNCTIONS = {
-    "calculate_expression": calculate_expression
-    # Note: 'retrieve_dudraw_functions' will be added in main_app.py
-    # because it requires an instance of DuDrawFunctionRetriever
-}
\ No newline at end of file
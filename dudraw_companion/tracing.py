@@ -0,0 +1,311 @@
+"""
+Per-request tracing and aggregated metrics for the agent loop.
+
+Code under measurement wraps work in `span(name, **attributes)`. Every span is
+  - recorded in the current request's RunTrace (if one was started), whose summary()
+    is attached to the chat response,
+  - aggregated into METRICS, served in Prometheus text format by /api/metrics,
+  - handed to the configured Tracer: a no-op by default, or OpenTelemetry when
+    TRACING_EXPORTER=otel and the opentelemetry API is installed.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none")  # none | otel
+
+# Token counts recorded on LLM spans as <kind>_tokens: the API's usage numbers, plus the
+# locally counted context size sent to the model
+TOKEN_KINDS = ("prompt", "completion", "cached", "context")
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# --- Spans ---
+class Span:
+    """One timed unit of work (an LLM call, a tool call, a retrieval, ...)."""
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self, trace_start: float):
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - trace_start) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+            **({"error": self.error} if self.error else {}),
+            **self.attributes
+        }
+
+
+class Tracer:
+    """No-op tracer; subclasses forward spans to a tracing backend."""
+    def start(self, span: Span):
+        return None
+
+    def finish(self, span: Span, handle):
+        pass
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Forwards spans to the OpenTelemetry API. Exporters and sampling are configured the usual
+    OpenTelemetry way (SDK setup or `opentelemetry-instrument`); without an SDK the spans are no-ops.
+    """
+    def __init__(self):
+        from opentelemetry import context, trace
+        self._context = context
+        self._trace = trace
+        self._tracer = trace.get_tracer("dudraw")
+
+    def start(self, span: Span):
+        otel_span = self._tracer.start_span(f"dudraw.{span.name}")
+        # Make it the parent of spans started inside the block (e.g. embedding inside retrieval)
+        token = self._context.attach(self._trace.set_span_in_context(otel_span))
+        return otel_span, token
+
+    def finish(self, span: Span, handle):
+        otel_span, token = handle
+        self._context.detach(token)
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(f"dudraw.{key}", value)
+        if span.error:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end()
+
+
+def create_tracer(exporter: str):
+    if exporter == "otel":
+        try:
+            return OpenTelemetryTracer()
+        except ImportError:
+            print("TRACING_EXPORTER=otel but opentelemetry is not installed; tracing spans are not exported")
+    return Tracer()
+
+
+_tracer = create_tracer(TRACING_EXPORTER)
+
+def set_tracer(tracer: Tracer):
+    """Installs a custom tracer (e.g. a test double or another backend)."""
+    global _tracer
+    _tracer = tracer
+
+
+# --- Per-request Trace ---
+class RunTrace:
+    """The spans and cache lookups of one chat request."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.cache_lookups = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def record_cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            self.cache_lookups[cache] = "hit" if hit else "miss"
+
+    def summary(self, include_spans: bool = True):
+        """Time, calls and tokens per span name, plus every span in start order."""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        tokens = {kind: 0 for kind in TOKEN_KINDS}
+        for span in spans:
+            entry = totals.setdefault(span.name, {"calls": 0, "ms": 0.0})
+            entry["calls"] += 1
+            entry["ms"] += span.duration * 1000
+            for kind in tokens:
+                tokens[kind] += span.attributes.get(f"{kind}_tokens", 0) or 0
+        for entry in totals.values():
+            entry["ms"] = round(entry["ms"], 2)
+
+        summary = {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "steps": max((span.attributes.get("step", 0) for span in spans), default=0),
+            "tokens": tokens,
+            # Share of prompt tokens served from the provider's prompt cache
+            "prompt_cache_ratio": round(tokens["cached"] / tokens["prompt"], 4) if tokens["prompt"] else 0.0,
+            "cache": dict(self.cache_lookups),
+            "by_span": totals
+        }
+        if include_spans:
+            summary["spans"] = [span.to_dict(self.start) for span in sorted(spans, key=lambda s: s.start)]
+        return summary
+
+
+_current_trace = contextvars.ContextVar("dudraw_trace", default=None)
+
+def start_trace():
+    """Starts recording the spans of the current request (thread or asyncio task)."""
+    trace = RunTrace()
+    _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block; attributes can be added while it runs with span.set()."""
+    current = Span(name, attributes)
+    handle = _tracer.start(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _tracer.finish(current, handle)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+        METRICS.observe_span(current)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Counts a response, semantic, pre_retrieval or single_flight cache lookup and notes it in the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_cache_lookup(cache, hit)
+    METRICS.inc("dudraw_cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+
+
+# --- Aggregated Metrics ---
+METRIC_HELP = {
+    "dudraw_requests_total": ("counter", "Chat requests (batch: items) by endpoint and cache outcome."),
+    "dudraw_request_duration_seconds": ("histogram", "Chat request duration by endpoint."),
+    "dudraw_span_duration_seconds": ("histogram", "Duration of traced agent work (llm, tool, retrieval, embedding, vector_query)."),
+    "dudraw_span_errors_total": ("counter", "Traced agent work that raised an error."),
+    "dudraw_llm_tokens_total": ("counter", "LLM tokens by kind (prompt, completion and cached prompt tokens reported by the API, locally counted context tokens)."),
+    "dudraw_cache_lookups_total": ("counter", "Response, semantic, pre-retrieval and single-flight cache lookups by result."),
+    "dudraw_cache_hit_ratio": ("gauge", "Hit ratio of the embedding, response and semantic caches."),
+    "dudraw_cache_entries": ("gauge", "Entries held by the embedding (memory layer), response and semantic caches."),
+    "dudraw_sandbox_runs_total": ("counter", "Programs run in the preview sandbox by outcome."),
+    "dudraw_single_flight_requests_total": ("counter", "Agent runs by single-flight role: leader (ran the agent), follower (waited for a leader), timeout (follower gave up waiting)."),
+    "dudraw_single_flight_max_fanout": ("gauge", "Most followers that have shared a single leader's run."),
+    "dudraw_upstream_queue_depth": ("gauge", "OpenAI chat calls waiting for rate-limit capacity, by priority."),
+    "dudraw_upstream_queue_wait_seconds": ("histogram", "Time OpenAI chat calls waited for rate-limit capacity, by priority."),
+    "dudraw_upstream_queue_timeouts_total": ("counter", "OpenAI chat calls that gave up waiting for rate-limit capacity, by priority."),
+    "dudraw_upstream_retries_total": ("counter", "Retried OpenAI chat calls by reason (HTTP status or error type)."),
+    "dudraw_upstream_rate_limit": ("gauge", "Requests and tokens per minute the upstream limiter allows (learned from x-ratelimit-* headers)."),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms rendered in the Prometheus text format."""
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def observe_span(self, span: Span):
+        self.observe("dudraw_span_duration_seconds", span.duration, span=span.name)
+        if span.error:
+            self.inc("dudraw_span_errors_total", span=span.name)
+        for kind in TOKEN_KINDS:
+            tokens = span.attributes.get(f"{kind}_tokens")
+            if tokens:
+                self.inc("dudraw_llm_tokens_total", tokens, kind=kind)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()}
+
+        lines = []
+        names = sorted({name for name, _ in list(counters) + list(gauges) + list(histograms)})
+        for name in names:
+            metric_type, help_text = METRIC_HELP.get(name, ("gauge" if any(key[0] == name for key in gauges) else "counter", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry; each gunicorn worker serves its own numbers
+METRICS = MetricsRegistry()
+
+
+def finish_trace(trace: RunTrace, endpoint: str, cache: str):
+    """Ends the current request's trace, counts the request and returns its summary."""
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    summary = trace.summary()
+    METRICS.inc("dudraw_requests_total", endpoint=endpoint, cache=cache)
+    METRICS.observe("dudraw_request_duration_seconds", summary["total_ms"] / 1000, endpoint=endpoint)
+    return summary
+
+
+def update_cache_gauges(caches: dict):
+    """Copies cache statistics ({cache name: stats or None}, see DuDrawAgent.cache_stats) into gauges."""
+    for cache, stats in caches.items():
+        if stats is None:
+            continue
+        METRICS.set_gauge("dudraw_cache_hit_ratio", stats["hit_rate"], cache=cache)
+        entries = stats.get("entries", stats.get("memory_entries"))
+        if entries is not None:
+            METRICS.set_gauge("dudraw_cache_entries", entries, cache=cache)
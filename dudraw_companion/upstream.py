@@ -0,0 +1,363 @@
+"""
+Shared rate limiting and retries for the agent's OpenAI chat-completion calls.
+
+Every chat completion in the process waits for capacity in one limiter (UPSTREAM):
+
+- Token buckets for requests and tokens per minute. They start at UPSTREAM_REQUESTS_PER_MINUTE
+  and UPSTREAM_TOKENS_PER_MINUTE and follow the account's real limits from the x-ratelimit-*
+  response headers. A call needs its prompt tokens plus its max_tokens.
+- A priority queue: calls of interactive chats go before those of batch items
+  (see request_priority), and calls of the same priority go first come, first served.
+- Retries of 429s, 5xx responses, timeouts and connection errors, with jittered exponential
+  backoff (or the server's retry-after). A 429 also pauses every other queued call.
+
+Only opening the stream is retried; an error after tokens were streamed still ends the run.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from . import config, tracing
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+# 408 request timeout, 409 lock timeout, 429 rate limit, and server errors
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+_priority = contextvars.ContextVar("dudraw_upstream_priority", default=PRIORITY_INTERACTIVE)
+
+
+def _priority_name(priority: int):
+    return PRIORITY_NAMES.get(priority, str(priority))
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Upstream calls made in the enclosed block (same thread or asyncio task) queue with this priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class UpstreamQueueTimeout(Exception):
+    """A call waited longer than UPSTREAM_MAX_QUEUE_SECONDS for rate-limit capacity."""
+
+
+# --- Limiter ---
+class _Bucket:
+    """Refills continuously at limit per minute, up to limit; a limit of 0 means unlimited."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.limit > 0:
+            self.level = min(self.limit, self.level + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def wait_for(self, amount: float):
+        """Seconds until amount is available; a call larger than the whole limit waits for a full bucket."""
+        if self.limit <= 0:
+            return 0.0
+        return max(0.0, (min(amount, self.limit) - self.level) * 60 / self.limit)
+
+    def take(self, amount: float):
+        if self.limit > 0:
+            self.level -= min(amount, self.limit)
+
+    def give_back(self, amount: float):
+        """Returns capacity taken for a call that never went out."""
+        if self.limit > 0:
+            self.level = min(self.limit, self.level + min(amount, self.limit))
+
+    def learn(self, limit, remaining):
+        """Adopts the limit the server reports; its remaining count only ever lowers the level (it lags in-flight calls)."""
+        if limit:
+            if self.limit <= 0:
+                # Unlimited until now: the level was never tracked, so start from what the server reports
+                self.level = float(remaining if remaining is not None else limit)
+            self.limit = limit
+            self.level = min(self.level, limit)
+        if remaining is not None and self.limit > 0:
+            self.level = min(self.level, remaining)
+
+
+class _Waiter:
+    """A queued call: woken through an Event (threads) or a future on its event loop (asyncio)."""
+    def __init__(self, priority: int, sequence: int, tokens: int, loop=None):
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_set_future_result, self.future)
+
+
+def _set_future_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _header_number(headers, name: str):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamLimiter:
+    """Request and token buckets behind a priority queue; safe to share between threads and event loops."""
+    def __init__(self, requests_per_minute: int = config.UPSTREAM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = config.UPSTREAM_TOKENS_PER_MINUTE,
+                 max_queue_seconds: float = config.UPSTREAM_MAX_QUEUE_SECONDS):
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.max_queue_seconds = max_queue_seconds
+        self._queue = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._counts = {"granted": 0, "retries": 0, "rate_limit_pauses": 0, "queue_timeouts": 0}
+
+    def _dispatch(self):
+        """Grants queued calls in priority order while capacity lasts; returns seconds until the next one can go. Holds the lock."""
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while self._queue:
+            head = self._queue[0]
+            delay = max(self._paused_until - now, self.requests.wait_for(1), self.tokens.wait_for(head.tokens))
+            if delay > 0:
+                return delay
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(head.tokens)
+            head.granted = True
+            self._counts["granted"] += 1
+            head.wake()
+        return 0.0
+
+    def _record_depth(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for waiter in self._queue:
+            name = _priority_name(waiter.priority)
+            depth[name] = depth.get(name, 0) + 1
+        for name, count in depth.items():
+            tracing.METRICS.set_gauge("dudraw_upstream_queue_depth", count, priority=name)
+        return depth
+
+    def _enqueue(self, tokens: int, loop=None):
+        waiter = _Waiter(_priority.get(), next(self._sequence), tokens, loop)
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+            delay = self._dispatch()
+            self._record_depth()
+        return waiter, delay
+
+    def _redispatch(self, waiter: _Waiter, start: float):
+        """Dispatches again after a waiter woke up; gives up on it once it has queued for max_queue_seconds."""
+        with self._lock:
+            delay = self._dispatch()
+            timed_out = not waiter.granted and time.monotonic() - start >= self.max_queue_seconds
+            if timed_out:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._counts["queue_timeouts"] += 1
+            self._record_depth()
+        if timed_out:
+            tracing.METRICS.inc("dudraw_upstream_queue_timeouts_total", priority=_priority_name(waiter.priority))
+            raise UpstreamQueueTimeout(f"OpenAI rate limit: no capacity within {self.max_queue_seconds} s")
+        return delay
+
+    def _abandon(self, waiter: _Waiter):
+        """Forgets a cancelled waiter: drops it from the queue, or refunds the capacity it was already granted."""
+        with self._lock:
+            if waiter.granted:
+                self.requests.give_back(1)
+                self.tokens.give_back(waiter.tokens)
+                self._counts["granted"] -= 1
+            elif waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+            # The calls behind it may be able to go now
+            self._dispatch()
+            self._record_depth()
+
+    def _sleep_time(self, delay: float, start: float):
+        # Small margin so the bucket has refilled when the waiter checks again
+        return max(0.001, min(delay + 0.001, start + self.max_queue_seconds - time.monotonic()))
+
+    def _granted(self, waiter: _Waiter, start: float):
+        waited = time.monotonic() - start
+        tracing.METRICS.observe("dudraw_upstream_queue_wait_seconds", waited, priority=_priority_name(waiter.priority))
+        return waited
+
+    def acquire(self, tokens: int):
+        """Blocks until a call needing tokens may start; returns the seconds it waited."""
+        start = time.monotonic()
+        waiter, delay = self._enqueue(tokens)
+        while not waiter.granted:
+            waiter.event.wait(self._sleep_time(delay, start))
+            delay = self._redispatch(waiter, start)
+        return self._granted(waiter, start)
+
+    async def acquire_async(self, tokens: int):
+        """Asyncio variant of acquire()."""
+        start = time.monotonic()
+        waiter, delay = self._enqueue(tokens, asyncio.get_running_loop())
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self._sleep_time(delay, start))
+                except asyncio.TimeoutError:
+                    pass
+                delay = self._redispatch(waiter, start)
+        except asyncio.CancelledError:
+            # The task was cancelled (client disconnect, timeout): no call will use this place or capacity
+            self._abandon(waiter)
+            raise
+        return self._granted(waiter, start)
+
+    def update_from_headers(self, headers):
+        """Learns the account's limits and remaining capacity from a response's x-ratelimit-* headers."""
+        limits = {}
+        with self._lock:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                bucket.learn(_header_number(headers, f"x-ratelimit-limit-{kind}"), _header_number(headers, f"x-ratelimit-remaining-{kind}"))
+                limits[kind] = bucket.limit
+        for kind, limit in limits.items():
+            tracing.METRICS.set_gauge("dudraw_upstream_rate_limit", limit, kind=kind)
+
+    def pause(self, seconds: float):
+        """Holds back every queued call for seconds, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._counts["rate_limit_pauses"] += 1
+
+    def record_retry(self):
+        """Counts a call that failed and will be retried (after a 429, a 5xx, a timeout or a connection error)."""
+        with self._lock:
+            self._counts["retries"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests.limit,
+                "tokens_per_minute": self.tokens.limit,
+                "queued": self._record_depth(),
+                "paused_ms": round(max(0.0, self._paused_until - time.monotonic()) * 1000, 2),
+                **self._counts
+            }
+
+
+# Shared by every chat completion in this process (one OpenAI account)
+UPSTREAM = UpstreamLimiter()
+
+
+# --- Retries ---
+def _retry_after(headers):
+    """The server's requested delay in seconds (retry-after-ms or retry-after), if any."""
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int):
+    """Seconds to wait before retrying a failed call, or None if the error is not worth retrying."""
+    import openai
+    retry_after = None
+    if isinstance(error, openai.APIStatusError):
+        # An exhausted quota also comes back as 429, but waiting does not help
+        if error.status_code not in RETRYABLE_STATUS_CODES or error.code == "insufficient_quota":
+            return None
+        retry_after = _retry_after(error.response.headers)
+    elif not isinstance(error, openai.APIConnectionError):
+        return None
+    backoff = config.UPSTREAM_BACKOFF_BASE_SECONDS * 2 ** attempt
+    if retry_after is not None:
+        return min(config.UPSTREAM_BACKOFF_MAX_SECONDS, retry_after) + random.uniform(0, config.UPSTREAM_BACKOFF_BASE_SECONDS)
+    # Full jitter: concurrent callers that failed together do not retry together
+    return random.uniform(0, min(config.UPSTREAM_BACKOFF_MAX_SECONDS, backoff))
+
+
+class RateLimitedChat:
+    """chat.completions.create of an OpenAI client, behind a limiter and with retries."""
+    def __init__(self, client, limiter: UpstreamLimiter = None):
+        self.client = client
+        self.limiter = limiter if limiter is not None else UPSTREAM
+
+    def _retry(self, error: Exception, attempt: int, llm_span=None):
+        """Returns the delay before the next attempt, or re-raises the error."""
+        delay = retry_delay(error, attempt) if attempt < config.UPSTREAM_MAX_RETRIES else None
+        if delay is None:
+            raise error
+        status = getattr(error, "status_code", None)
+        if status == 429:
+            self.limiter.pause(delay)
+        self.limiter.record_retry()
+        reason = str(status) if status is not None else type(error).__name__
+        tracing.METRICS.inc("dudraw_upstream_retries_total", reason=reason)
+        print(f"OpenAI call failed ({reason}), retrying in {delay:.2f} s")
+        if llm_span is not None:
+            llm_span.set("retries", attempt + 1)
+        return delay
+
+    @staticmethod
+    def _note_wait(llm_span, waited: float):
+        if llm_span is not None:
+            llm_span.set("queue_ms", round(llm_span.attributes.get("queue_ms", 0) + waited * 1000, 2))
+
+    def create(self, kwargs: dict, tokens: int, llm_span=None):
+        """Starts a completion once the limiter allows tokens; returns what client.chat.completions.create would."""
+        attempt = 0
+        while True:
+            self._note_wait(llm_span, self.limiter.acquire(tokens))
+            try:
+                response = self.client.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                time.sleep(self._retry(e, attempt, llm_span))
+                attempt += 1
+                continue
+            self.limiter.update_from_headers(response.headers)
+            return response.parse()
+
+
+class AsyncRateLimitedChat(RateLimitedChat):
+    """RateLimitedChat for an AsyncOpenAI client."""
+    async def create(self, kwargs: dict, tokens: int, llm_span=None):
+        attempt = 0
+        while True:
+            self._note_wait(llm_span, await self.limiter.acquire_async(tokens))
+            try:
+                response = await self.client.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry(e, attempt, llm_span))
+                attempt += 1
+                continue
+            self.limiter.update_from_headers(response.headers)
+            return response.parse()
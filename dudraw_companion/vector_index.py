@@ -0,0 +1,49 @@
+import numpy as np
+
+# --- In-process Vector Index ---
+class VectorIndex:
+    """
+    A small in-memory cosine-similarity index over the DuDraw function catalog.
+
+    The normalized catalog embeddings are kept in one contiguous float32 matrix, so a
+    query is a single matrix-vector product followed by an argpartition. For a catalog
+    of ~50 rows this is far cheaper than starting a ChromaDB client.
+
+    With normalized=True the embeddings are used as they are, so a memory-mapped matrix
+    from the warm-start snapshot is queried without being copied into memory first.
+    """
+    def __init__(self, ids, embeddings, metadatas, normalized: bool = False):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids) or len(ids) != len(metadatas):
+            raise ValueError("VectorIndex needs one embedding row and one metadata entry per id")
+        self.ids = list(ids)
+        self.metadatas = list(metadatas)
+        self.matrix = matrix if normalized else self._normalize(matrix)
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def count(self):
+        return len(self.ids)
+
+    def _top_k(self, scores, n_results: int):
+        """Indices of the n_results highest scores along the last axis, best first."""
+        k = min(n_results, scores.shape[-1])
+        if k <= 0:
+            return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind="stable")
+        return np.take_along_axis(top, order, axis=-1)
+
+    def query(self, embedding, n_results: int = 6):
+        """Returns the metadata of the n_results catalog entries closest to one query embedding."""
+        return self.query_many([embedding], n_results)[0]
+
+    def query_many(self, embeddings, n_results: int = 6):
+        """Returns the closest catalog metadata for each of a batch of query embeddings."""
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.matrix.shape[1]))
+        scores = queries @ self.matrix.T
+        return [[self.metadatas[i] for i in row] for row in self._top_k(scores, n_results)]
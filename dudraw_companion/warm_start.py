@@ -0,0 +1,194 @@
+"""
+Warm-start snapshot of the retriever state.
+
+Cold containers otherwise rebuild everything the retriever needs: the BM25 lexical index,
+the identifier index and the catalog vector index. The snapshot stores all three for the
+current catalog hash (see catalog_artifact.py), next to the catalog embeddings:
+
+- `snapshot-<hash>.npy`: the normalized float32 catalog matrix, loaded memory-mapped
+- `snapshot-<hash>.json`: ids, metadata and the serialized lexical and identifier indexes
+
+It is packaged with the function and rebuilt whenever the catalog or the index format changes:
+
+    python -m dudraw_companion.warm_start
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+from du_draw_functions_data import DU_DRAW_FUNCTIONS
+
+from . import config
+from .catalog_artifact import ARTIFACT_DIR, build_catalog_documents, catalog_hash, load_catalog_embeddings
+from .identifier_index import IdentifierIndex
+from .lexical_index import LexicalIndex
+
+# Bump whenever the serialized index layout or the tokenizer changes
+SNAPSHOT_FORMAT = 1
+
+
+def _snapshot_paths(content_hash: str, directory: str):
+    base = os.path.join(directory, f"snapshot-{content_hash}")
+    return base + ".npy", base + ".json"
+
+
+def write_snapshot(model_name: str = config.EMBEDDING_MODEL_NAME, directory: str = ARTIFACT_DIR):
+    """
+    Builds the indexes and writes the snapshot. The catalog matrix is included when the
+    catalog embeddings artifact exists; otherwise only the offline indexes are stored.
+    Returns the paths written.
+    """
+    content_hash = catalog_hash(model_name)
+    _, metadatas, ids = build_catalog_documents()
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "catalog_hash": content_hash,
+        "model": model_name,
+        "ids": ids,
+        "metadatas": metadatas,
+        "lexical_index": LexicalIndex().to_state(),
+        "identifier_index": IdentifierIndex().to_state(),
+        "dimensions": None
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    vectors_path, state_path = _snapshot_paths(content_hash, directory)
+    written = []
+    artifact = load_catalog_embeddings(model_name, directory)
+    if artifact is not None:
+        from .vector_index import VectorIndex
+        matrix = VectorIndex(artifact["ids"], artifact["embeddings"], artifact["metadatas"]).matrix
+        import numpy as np
+        np.save(vectors_path, matrix)
+        snapshot["dimensions"] = int(matrix.shape[1])
+        written.append(vectors_path)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    written.append(state_path)
+
+    for name in os.listdir(directory):
+        if name.startswith("snapshot-") and not name.startswith(f"snapshot-{content_hash}."):
+            os.remove(os.path.join(directory, name))
+    return written
+
+
+def snapshot_available(model_name: str = config.EMBEDDING_MODEL_NAME, directory: str = ARTIFACT_DIR, with_vectors: bool = False):
+    """Whether a snapshot of the current catalog exists (only checks the files, loads nothing)."""
+    vectors_path, state_path = _snapshot_paths(catalog_hash(model_name), directory)
+    return os.path.exists(state_path) and (not with_vectors or os.path.exists(vectors_path))
+
+
+def load_snapshot(model_name: str = config.EMBEDDING_MODEL_NAME, directory: str = ARTIFACT_DIR):
+    """
+    Loads the snapshot of the current catalog, or returns None if there is none (or it is
+    stale). The returned dict holds the restored "lexical_index" and "identifier_index"
+    and, when the snapshot has vectors, the memory-mapped "matrix".
+    """
+    content_hash = catalog_hash(model_name)
+    vectors_path, state_path = _snapshot_paths(content_hash, directory)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("catalog_hash") != content_hash:
+        return None
+
+    metadatas, ids = snapshot["metadatas"], snapshot["ids"]
+    snapshot["lexical_index"] = LexicalIndex.from_state(snapshot["lexical_index"], metadatas, ids)
+    snapshot["identifier_index"] = IdentifierIndex.from_state(snapshot["identifier_index"], metadatas, ids)
+    snapshot["matrix"] = None
+    if snapshot["dimensions"] and os.path.exists(vectors_path):
+        import numpy as np
+        # Pages are read on first use and shared with any other process mapping the file
+        snapshot["matrix"] = np.load(vectors_path, mmap_mode="r")
+    return snapshot
+
+
+# --- Process-wide catalog indexes ---
+_indexes = None
+_indexes_lock = threading.Lock()
+
+
+def catalog_indexes():
+    """
+    The process's shared (snapshot or None, lexical index, identifier index), created once.
+    The indexes come from the snapshot when it matches the catalog, otherwise they are built.
+    """
+    global _indexes
+    if _indexes is None:
+        with _indexes_lock:
+            if _indexes is None:
+                snapshot = None
+                try:
+                    snapshot = load_snapshot()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Ignoring unreadable warm-start snapshot: {e}")
+                if snapshot is not None:
+                    _indexes = (snapshot, snapshot["lexical_index"], snapshot["identifier_index"])
+                else:
+                    _indexes = (None, LexicalIndex(), IdentifierIndex())
+    return _indexes
+
+
+def eager_init_is_cheap(backend: str = config.RETRIEVER_BACKEND, mode: str = config.RETRIEVER_MODE):
+    """
+    Whether to create the agent at import time (AGENT_EAGER_INIT=auto): only when the snapshot
+    covers everything the retriever needs, so creation makes no API calls and imports no chromadb.
+    """
+    if config.AGENT_EAGER_INIT in ("true", "false"):
+        return config.AGENT_EAGER_INIT == "true"
+    if mode == "lexical":
+        return snapshot_available()
+    return backend == "numpy" and snapshot_available(with_vectors=True)
+
+
+# --- Instance Status ---
+class InstanceStatus:
+    """Whether this process has served requests before (warm) or not (cold), and how long its init took."""
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.init_ms = None
+        self.eager = False
+        self._lock = threading.Lock()
+
+    def record_init(self, seconds: float, eager: bool = False):
+        self.init_ms = round(seconds * 1000, 2)
+        self.eager = eager
+
+    def begin_request(self):
+        """Counts a request; returns "cold" for the first request this process serves, "warm" after."""
+        with self._lock:
+            self.requests += 1
+            return "cold" if self.requests == 1 else "warm"
+
+    def report(self, state: str, snapshot: bool = None):
+        return {
+            "state": state,
+            "init_ms": self.init_ms,
+            "eager_init": self.eager,
+            "warm_start_snapshot": snapshot,
+            "requests_served": self.requests,
+            "uptime_seconds": round(time.time() - self.started, 1)
+        }
+
+
+INSTANCE = InstanceStatus()
+
+
+def main(argv):
+    # The runtime's model, so snapshot_available() finds the snapshot at startup
+    model_name = config.EMBEDDING_MODEL_NAME
+    for path in write_snapshot(model_name):
+        print(f"Wrote {path}")
+    if not snapshot_available(model_name, with_vectors=True):
+        print("No catalog embeddings for this catalog: the snapshot has no vectors. "
+              "Run `python -m dudraw_companion.catalog_artifact` first for the numpy backend.")
+    print(f"Snapshot of {len(DU_DRAW_FUNCTIONS)} DuDraw functions (catalog-{catalog_hash(model_name)})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))